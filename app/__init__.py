@@ -1,15 +1,135 @@
 # -*- coding: utf-8 -*-
+import asyncio
+
 from aiohttp import web
 from .routes import setup as setup_routers
 from .middlewares import setup as setup_middlewares
+from .config import get_config
+from .drone import get_drone_controller
+from .drone.fleet import Fleet
+from .drone.rc import RcSender
+from .drone.scheduler import CommandScheduler
+from .drone.telemetry import TelemetryPoller
+from .events.spool import EventSpool
+from .events.uploader import EventUploader
+from .hls import PlaylistCache
+from .broadcast import VideoBroadcaster
+from .clusters import ClusterIndex, Geotagger
+from .image_recognition.image_process import StreamToImagesThread, ImageProcessingThread
+from .image_recognition.payload import PayloadEncoder
+from .image_recognition.scheduler import MotionGate
+from .image_recognition.tracker import IouTracker
 
 
 async def on_startup(app):
-    pass
+    """
+    Only builds the subsystems, everything slow runs in the background: the drone sockets are bound by a
+    task and the detector is loaded by its thread. /ready tells when they are up.
+    """
+    conf = get_config(app)
+
+    fleet = app['fleet'] = Fleet(conf.drones, hls_time=conf.hls_time, hls_list_size=conf.get_hls_list_size())
+    app['fleet_connect'] = asyncio.ensure_future(fleet.connect())
+
+    app['telemetry'] = {}
+    app['command_scheduler'] = {}
+    app['rc_sender'] = {}
+    app['playlist'] = {}
+    app['video_broadcaster'] = {}
+    app['clusters'] = {}
+
+    for drone_id, drone_controller in fleet.items():
+        app['telemetry'][drone_id] = TelemetryPoller(drone_controller, conf.telemetry_interval)
+        app['telemetry'][drone_id].start()
+
+        app['command_scheduler'][drone_id] = CommandScheduler(drone_controller, conf.command_interval)
+        app['command_scheduler'][drone_id].start()
+
+        app['rc_sender'][drone_id] = RcSender(drone_controller, conf.rc_rate, conf.rc_deadman)
+        app['rc_sender'][drone_id].start()
+
+        app['playlist'][drone_id] = PlaylistCache(drone_controller.get_playlist_path())
+        app['playlist'][drone_id].start()
+
+        app['video_broadcaster'][drone_id] = VideoBroadcaster()
+        app['video_broadcaster'][drone_id].start()
+        drone_controller.add_video_listener(app['video_broadcaster'][drone_id].publish)
+
+        app['clusters'][drone_id] = ClusterIndex(conf.cluster_radius)
+
+    if conf.detection_enabled:
+        await start_detection(app, conf)
+
+
+async def start_detection(app, conf):
+    spool = None
+    if conf.event_spool_dir is not None:
+        spool = EventSpool(conf.event_spool_dir)
+
+    app['uploader'] = EventUploader(conf.event_url, conf.drone_id, conf.event_batch_size, conf.event_batch_wait,
+                                    conf.event_queue_size, conf.event_upload_mode, spool=spool)
+
+    gate = None
+    if conf.motion_threshold is not None:
+        gate = MotionGate(conf.motion_threshold, conf.motion_max_interval)
+
+    tracker = None
+    if conf.track_iou_threshold is not None:
+        tracker = IouTracker(conf.track_iou_threshold, conf.track_max_missed, conf.track_max_age)
+
+    drone_controller = get_drone_controller(app)
+    geotagger = Geotagger(drone_controller, app['clusters'][conf.default_drone])
+
+    payload = PayloadEncoder(conf.event_image_mode, conf.event_jpeg_quality, conf.event_thumbnail_size)
+
+    # The model is warmed up on load with the frames it will get, the first real frames don't build its graph.
+    manager_options = {
+        'backend': conf.detection_backend,
+        'profile': conf.detection_profile,
+        'model_path': conf.detection_model_path,
+        'backend_options': conf.detection_backend_options,
+        'warmup_frame_size': conf.detection_frame_size,
+        'warmup_batch_size': conf.detection_batch_size,
+    }
+
+    app['image_process_thread'] = ImageProcessingThread(conf.detection_source, conf.detection_batch_size,
+                                                        conf.detection_batch_wait, conf.detection_workers, gate,
+                                                        app['uploader'], tracker, geotagger, payload,
+                                                        conf.detection_debug, manager_options)
+
+    if conf.detection_source == 'pipe':
+        drone_controller.add_raw_decoder(app['image_process_thread'].put_frame, *conf.detection_frame_size,
+                                         fps=conf.detection_fps)
+    else:
+        app['stream_to_image_thread'] = StreamToImagesThread(drone_controller.get_playlist_path(),
+                                                             app['image_process_thread'].put_photo)
+        app['stream_to_image_thread'].start()
+
+    app['image_process_thread'].start()
+    await app['uploader'].start()
 
 
 async def on_shutdown(app):
-    pass
+    conf = get_config(app)
+    loop = asyncio.get_running_loop()
+    app['fleet_connect'].cancel()
+
+    for playlist in app['playlist'].values():
+        await playlist.stop()
+    # The detections in flight still go to the uploader, it is closed after.
+    for name in ('stream_to_image_thread', 'image_process_thread'):
+        if name in app:
+            app[name].stop()
+            await loop.run_in_executor(None, app[name].join, conf.detection_stop_timeout)
+    if 'uploader' in app:
+        await app['uploader'].close()
+    for telemetry in app['telemetry'].values():
+        await telemetry.stop()
+    for scheduler in app['command_scheduler'].values():
+        await scheduler.stop()
+    for rc_sender in app['rc_sender'].values():
+        await rc_sender.stop()
+    await app['fleet'].close()
 
 
 def create(conf=None):
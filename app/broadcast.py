@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+
+from app.drone.video import nal_unit_types
+
+logger = logging.getLogger(__name__)
+
+SPS, PPS, IDR = 7, 8, 5
+
+
+class VideoSubscriber:
+    """
+    Bounded queue of frames for one websocket.
+
+    When the client is too slow and the queue fills up, everything queued is dropped and so is every frame
+    until the next keyframe, from which the client can decode again. The other subscribers are not affected.
+    """
+
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(queue_size)
+        self.waiting_keyframe = False
+
+        self.sent = 0
+        self.dropped = 0
+        self.latency = 0.0
+
+    def offer(self, frame, keyframe, received_at):
+        if self.waiting_keyframe and not keyframe:
+            self.dropped += 1
+            return
+
+        if self.queue.full():
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+
+            if not keyframe:
+                self.waiting_keyframe = True
+                self.dropped += 1
+                return
+
+        self.waiting_keyframe = False
+        self.queue.put_nowait((frame, received_at))
+
+    async def send_to(self, websocket):
+        while True:
+            frame, received_at = await self.queue.get()
+            await websocket.send_bytes(frame)
+
+            self.sent += 1
+            self.latency = time.perf_counter() - received_at
+
+
+class VideoBroadcaster:
+    """
+    Fans the H.264 frames reassembled by the VideoReceiver out to websocket subscribers.
+
+    The latest SPS, PPS and keyframe are cached, so a late joiner starts with a decodable frame.
+    """
+
+    def __init__(self, queue_size=30):
+        self.queue_size = queue_size
+        self.subscribers = set()
+
+        self.parameter_sets = {}
+        self.keyframe = None
+
+        self._loop = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    def publish(self, frame, keyframe):
+        """
+        VideoReceiver listener, called from the receiving thread.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._dispatch, frame, keyframe, time.perf_counter())
+
+    def subscribe(self):
+        subscriber = VideoSubscriber(self.queue_size)
+
+        received_at = time.perf_counter()
+        for frame in self._decoder_setup():
+            subscriber.offer(frame, True, received_at)
+
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def stats(self):
+        return [
+            {'sent': subscriber.sent, 'dropped': subscriber.dropped, 'latency': subscriber.latency}
+            for subscriber in self.subscribers
+        ]
+
+    def _decoder_setup(self, keyframe=None):
+        keyframe = self.keyframe if keyframe is None else keyframe
+
+        frames = []
+        for frame in (self.parameter_sets.get(SPS), self.parameter_sets.get(PPS), keyframe):
+            if frame is not None and all(frame is not other for other in frames):
+                frames.append(frame)
+        return frames
+
+    def _dispatch(self, frame, keyframe, received_at):
+        if keyframe:
+            for nal_type in nal_unit_types(frame):
+                if nal_type in (SPS, PPS):
+                    self.parameter_sets[nal_type] = frame
+                elif nal_type == IDR:
+                    self.keyframe = frame
+
+        for subscriber in self.subscribers:
+            if keyframe and subscriber.waiting_keyframe:
+                # The dropped frames may have held the parameter sets, resend them with the keyframe.
+                for setup_frame in self._decoder_setup(frame):
+                    subscriber.offer(setup_frame, True, received_at)
+            else:
+                subscriber.offer(frame, keyframe, received_at)
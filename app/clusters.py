@@ -0,0 +1,167 @@
+import itertools
+import math
+import threading
+
+
+class Cluster:
+    __slots__ = ('id', 'x', 'y', 'count', 'min_x', 'min_y', 'max_x', 'max_y', 'names', 'first_detected',
+                 'last_detected')
+
+    def __init__(self, cluster_id, x, y, name, detected_at):
+        self.id = cluster_id
+        self.x = x
+        self.y = y
+        self.count = 1
+        self.min_x = self.max_x = x
+        self.min_y = self.max_y = y
+        self.names = {name: 1}
+        self.first_detected = self.last_detected = detected_at
+
+    def add(self, x, y, name, detected_at):
+        self.count += 1
+        self.x += (x - self.x) / self.count
+        self.y += (y - self.y) / self.count
+        self.min_x, self.max_x = min(self.min_x, x), max(self.max_x, x)
+        self.min_y, self.max_y = min(self.min_y, y), max(self.max_y, y)
+        self.names[name] = self.names.get(name, 0) + 1
+        self.first_detected = min(self.first_detected, detected_at)
+        self.last_detected = max(self.last_detected, detected_at)
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'x': round(self.x, 2),
+            'y': round(self.y, 2),
+            'count': self.count,
+            'bbox': [self.min_x, self.min_y, self.max_x, self.max_y],
+            'names': dict(self.names),
+            'first_detected': self.first_detected,
+            'last_detected': self.last_detected,
+        }
+
+
+class ClusterIndex:
+    """
+    Groups geotagged detections in garbage clusters as they come, in a uniform grid of radius sized cells.
+
+    A detection joins the cluster with the nearest centroid within radius, found in the 3x3 cells around it, or
+    starts a new one. Clusters are bucketed by the cell of their centroid, so a bounding box query only visits
+    the cells it covers and its cost follows the clusters in the box, not the detections of the day.
+    """
+
+    def __init__(self, radius=5.0):
+        """
+        :param radius: Metres from a cluster centroid a detection joins it within.
+        """
+        self.radius = radius
+
+        self.clusters = {}
+        self._cells = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.clusters)
+
+    def add(self, x, y, name, detected_at):
+        """
+        Can be called from any thread.
+
+        :return (Cluster): The cluster the detection joined.
+        """
+        with self._lock:
+            cluster = self._nearest(x, y)
+
+            if cluster is None:
+                cluster = Cluster(next(self._ids), x, y, name, detected_at)
+                self.clusters[cluster.id] = cluster
+                self._cells.setdefault(self._cell(cluster.x, cluster.y), set()).add(cluster.id)
+                return cluster
+
+            cell = self._cell(cluster.x, cluster.y)
+            cluster.add(x, y, name, detected_at)
+
+            moved_to = self._cell(cluster.x, cluster.y)
+            if moved_to != cell:
+                self._discard(cell, cluster.id)
+                self._cells.setdefault(moved_to, set()).add(cluster.id)
+
+            return cluster
+
+    def query(self, min_x=-math.inf, min_y=-math.inf, max_x=math.inf, max_y=math.inf):
+        """
+        :return (list): Cluster dicts of the clusters with their centroid in the bounding box.
+        """
+        with self._lock:
+            cell_x1, cell_y1 = self._cell(max(min_x, -1e12), max(min_y, -1e12))
+            cell_x2, cell_y2 = self._cell(min(max_x, 1e12), min(max_y, 1e12))
+
+            # A box wider than the flown area visits the occupied cells rather than every cell it covers.
+            if (cell_x2 - cell_x1 + 1) * (cell_y2 - cell_y1 + 1) > len(self._cells):
+                cells = [ids for (cx, cy), ids in self._cells.items()
+                         if cell_x1 <= cx <= cell_x2 and cell_y1 <= cy <= cell_y2]
+            else:
+                cells = [self._cells[(cx, cy)]
+                         for cx in range(cell_x1, cell_x2 + 1) for cy in range(cell_y1, cell_y2 + 1)
+                         if (cx, cy) in self._cells]
+
+            # Serialized under the lock, the detection thread may be updating them.
+            return [
+                self.clusters[cluster_id].as_dict() for ids in cells for cluster_id in ids
+                if min_x <= self.clusters[cluster_id].x <= max_x and min_y <= self.clusters[cluster_id].y <= max_y
+            ]
+
+    def _cell(self, x, y):
+        return math.floor(x / self.radius), math.floor(y / self.radius)
+
+    def _discard(self, cell, cluster_id):
+        ids = self._cells[cell]
+        ids.discard(cluster_id)
+        if not ids:
+            del self._cells[cell]
+
+    def _nearest(self, x, y):
+        cell_x, cell_y = self._cell(x, y)
+        nearest, nearest_distance = None, self.radius
+
+        for cx in (cell_x - 1, cell_x, cell_x + 1):
+            for cy in (cell_y - 1, cell_y, cell_y + 1):
+                for cluster_id in self._cells.get((cx, cy), ()):
+                    cluster = self.clusters[cluster_id]
+                    distance = math.hypot(cluster.x - x, cluster.y - y)
+                    if distance <= nearest_distance:
+                        nearest, nearest_distance = cluster, distance
+
+        return nearest
+
+
+class Geotagger:
+    """
+    Tags detections with the pose the drone had when they were seen and adds them to its cluster index.
+    """
+
+    def __init__(self, drone_controller, clusters):
+        self.dc = drone_controller
+        self.clusters = clusters
+
+        self.tagged = 0
+        self.untagged = 0
+
+    def tag(self, detection, detected_at):
+        """
+        Sets detection['position'] to the pose of the drone and detection['cluster_id'], or None if the pose is
+        unknown.
+
+        :param detected_at: time.time() of the detection.
+        """
+        pose = self.dc.get_pose(detected_at)
+        detection['position'] = pose
+        detection['cluster_id'] = None
+
+        if pose is None:
+            self.untagged += 1
+            return
+
+        self.tagged += 1
+        cluster = self.clusters.add(pose['x'], pose['y'], detection['name'], detected_at)
+        detection['cluster_id'] = cluster.id
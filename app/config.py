@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import math
 import os
 
 import logging
@@ -24,6 +25,88 @@ class Main(Base):
     database_url = os.environ.get('DATABASE_URL')
     logging_level = logging.INFO
 
+    drone_id = 'Keren-001'
+    # DroneController options of every drone of the fleet, the routes without a drone id use default_drone.
+    drones = {
+        drone_id: {
+            'local_ip': '',
+            'local_port': 8889,
+            'tello_ip': '192.168.10.1',
+            'tello_port': 8889,
+            'state_port': 8890,
+            'video_port': 11111,
+        },
+    }
+    default_drone = drone_id
+
+    telemetry_interval = 2
+    # Minimum seconds between two commands sent to a Tello from /command.
+    command_interval = 0.1
+    # 'RC a b c d' messages of /command are streamed to the Tello at rc_rate Hz and zeroed after rc_deadman
+    # seconds without a new one.
+    rc_rate = 20
+    rc_deadman = 0.5
+
+    hls_time = 1
+    # Live window of the HLS playlist, segments leaving it are deleted. hls_dvr_seconds, when set, widens
+    # it to a time-shift buffer viewers can scrub back in.
+    hls_list_size = 10
+    hls_dvr_seconds = 5 * 60
+
+    @classmethod
+    def get_hls_list_size(cls):
+        if cls.hls_dvr_seconds:
+            return max(cls.hls_list_size, math.ceil(cls.hls_dvr_seconds / cls.hls_time))
+        return cls.hls_list_size
+
+    # Starts the detection pipeline and the event uploader with the app.
+    detection_enabled = True
+    # 'files' extracts PNGs from the HLS segments, 'pipe' decodes the video stream straight to arrays.
+    detection_source = 'files'
+    detection_frame_size = (960, 720)
+    detection_fps = 2
+    detection_batch_size = 4
+    detection_batch_wait = 0.5
+    # Detection processes used by the 'pipe' source, 0 runs the detector in the ImageProcessingThread.
+    detection_workers = os.cpu_count() or 1
+    # Writes the frames with detections, boxes drawn, to app/output_photos.
+    detection_debug = False
+    # Seconds the shutdown waits for the frames being detected.
+    detection_stop_timeout = 10
+    # Detector backend: 'imageai' runs the RetinaNet .h5 on Keras, 'tflite' and 'onnxruntime' run a conversion of
+    # it (e.g. an int8 or float16 .tflite, a tf2onnx export) at detection_model_path. detection_backend_options are
+    # the backend's other arguments, e.g. {'intra_op_threads': 4} for ONNX Runtime.
+    detection_backend = 'imageai'
+    detection_backend_options = {}
+    detection_model_path = None
+    # Input scaling of the detector, 'normal', 'fast', 'faster', 'fastest' or 'flash'.
+    detection_profile = 'normal'
+    # Frames of the 'pipe' source differing less than motion_threshold (mean 0-255 gray level difference) from
+    # the last detected one skip the detector, at most motion_max_interval in a row. None detects every frame.
+    motion_threshold = 6.0
+    motion_max_interval = 10
+    # Detections of the same object across frames are one event, sent when the object is gone or, for an object
+    # that stays in view, track_max_age seconds after it was first seen. None sends every detected frame.
+    track_iou_threshold = 0.3
+    track_max_missed = 3
+    track_max_age = 30.0
+    # Geotagged detections within cluster_radius metres of a cluster centroid join it.
+    cluster_radius = 5.0
+
+    event_url = os.environ.get('EVENT_URL', 'http://192.168.6.100:8080/event')
+    # 'base64' posts JSON batches, 'multipart' sends the images as binary parts.
+    event_upload_mode = 'base64'
+    # 'crops' sends an event per detection with the JPEG crop of its box, 'frame' an event per frame with the
+    # whole frame. event_thumbnail_size, when set, adds a thumbnail of the frame that long on its longest side.
+    event_image_mode = 'crops'
+    event_jpeg_quality = 85
+    event_thumbnail_size = None
+    event_batch_size = 8
+    event_batch_wait = 1.0
+    event_queue_size = 256
+    # Events are spooled to disk until the event server acknowledges them, None keeps them in memory only.
+    event_spool_dir = f'{os.getcwd()}/app/spool'
+
 
 class Test(Main):
     test = True
@@ -0,0 +1,22 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Connections:
+    def __init__(self):
+        self._web_sockets = set()
+
+    def __iter__(self):
+        return iter(self._web_sockets)
+
+    def __len__(self):
+        return len(self._web_sockets)
+
+    def register(self, websocket):
+        self._web_sockets.add(websocket)
+        logger.info('New websocket registered')
+
+    def unregister(self, websocket):
+        self._web_sockets.discard(websocket)
+        logger.info('New websocket unregistered')
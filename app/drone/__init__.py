@@ -1,7 +1,13 @@
-from app.drone.controller import DroneController
+from app.config import get_config
 
-drone_controller = DroneController('', 8889)
 
+def get_fleet(app):
+    return app['fleet']
 
-def get_drone_controller():
-    return drone_controller
+
+def get_drone_controller(app, drone_id=None):
+    """
+    :param drone_id: Id of the drone, the default_drone of the config if None.
+    :raises KeyError: If the drone is not part of the fleet.
+    """
+    return get_fleet(app)[get_config(app).default_drone if drone_id is None else drone_id]
@@ -1,178 +1,92 @@
+import asyncio
 import logging
+import os
 import re
 import socket
-import subprocess
-import time
-import threading
 
-import ffmpeg
+from app.drone.position import DeadReckoning
+from app.drone.protocol import CommandProtocol
+from app.drone.state import StateProtocol
+from app.drone.video import VideoReceiver
 
 logger = logging.getLogger(__name__)
 
 
+# The Tello only answers takeoff, land and the manoeuvres once they are over, they get longer timeouts than the
+# other commands.
 MAX_TIME_OUT = 15.0
+MANOEUVRE_TIMEOUT = 7.0
 
 
-class VideoReceiver:
-    VS_UDP_IP = '0.0.0.0'
-    VS_UDP_PORT = 11111
-    OUTFILE = "./stream/stream.m3u8"
-
-    def __init__(self, tello_ip, tello_port):
-        self.tello_address = (tello_ip, tello_port)
-        self.cap = None
-
-        self.grabbed = None
-        self.frame = None
-        self.stopped = False
-
-        self.socket_video = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # socket for receiving video stream
-        self.socket_video.bind(('', self.VS_UDP_PORT))
-
-        self.receive_raw_video_thread = threading.Thread(target=self._receive_raw_data_handler)
-
-        self.stream = (
-            ffmpeg
-                .input('pipe:0')
-                .output(self.OUTFILE, format='hls', start_number=0, hls_time=1, hls_list_size=0)
-                .overwrite_output()
-                .compile()
-        )
-
-    # def read_in_chunks(self, file, chunk_size=1024):
-    #     while True:
-    #         data = file.read(chunk_size)
-    #         if not data:
-    #             break
-    #         yield data
-
-    def _receive_raw_data_handler(self):
-
-        proc_stream = subprocess.Popen(self.stream, stdin=subprocess.PIPE)
-
-        packet_data = b''
-        while not self.stopped:
-            try:
-                # print(os.getcwd())
-                # f = open("./stream/data", 'rb')
-                # for chunk in self.read_in_chunks(f):
-                #     proc_stream.stdin.write(chunk)
-                # f.close()
-
-                res_string, ip = self.socket_video.recvfrom(2048)
-                packet_data += res_string
-                # end of frame
-                if len(res_string) != 1460:
-                    proc_stream.stdin.write(packet_data)
-                    packet_data = b''
-
-            except socket.error as exc:
-                logger.error("Caught exception socket.error : {}".format(exc))
-
-        proc_stream.terminate()
-        self.stopped = False
-
-    def start_video(self):
-        self.receive_raw_video_thread.start()
-
-    def stop_video(self):
-        self.stopped = True
-
 class CmdController:
-    def __init__(self, socket, tello_address, imperial=False, command_timeout=.3):
-        self.socket = socket
+    def __init__(self, protocol, tello_address, imperial=False, command_timeout=.3, keepalive_interval=10):
+        self.protocol = protocol
         self.tello_address = tello_address
 
         self.response = None
-        self.abort_flag = False
         self.command_timeout = command_timeout
+        self.keepalive_interval = keepalive_interval
         self.imperial = imperial
         self.last_height = 0
 
-        self.lock = threading.Lock()
-
-        self._command_thread = threading.Thread(target=self._send_command_handler)
-        self._command_thread.start()
+        self.lock = asyncio.Lock()
 
-        self._status_thread = threading.Thread(target=self._get_status_handler)
-        self._status_thread.start()
+        self._command_task = asyncio.ensure_future(self._send_command_handler())
 
-    def send_command(self, command):
+    async def send_command(self, command, timeout=None):
         """
         Send a command to the Tello and wait for a response.
 
         :param command: Command to send.
+        :param timeout: Seconds to wait for the response, command_timeout if None.
         :return (str): Response from Tello.
 
         """
 
-        try:
-            self.lock.acquire(True, timeout=0.05)
-
+        async with self.lock:
             logger.info(">> send cmd: {}".format(command))
-            self.abort_flag = False
-            timer = threading.Timer(self.command_timeout, self.set_abort_flag)
-
-            self.socket.sendto(command.encode('utf-8'), self.tello_address)
 
-            timer.start()
-            while self.response is None:
-                if self.abort_flag is True:
-                    break
-            timer.cancel()
+            try:
+                self.response = await self.protocol.request(
+                    command.encode('utf-8'), self.tello_address,
+                    self.command_timeout if timeout is None else timeout
+                )
+            except asyncio.TimeoutError:
+                self.response = None
+                return 'none_response'
 
-            if self.response is None:
+            try:
+                response = self.response.decode('utf-8')
+            except UnicodeDecodeError as e:
+                logger.info(f'UnicodeDecodeError: {e}')
                 response = 'none_response'
-            else:
-                try:
-                    response = self.response.decode('utf-8')
-                except UnicodeDecodeError as e:
-                    logger.info(f'UnicodeDecodeError: {e}')
-                    response = 'none_response'
-
-            self.response = None
-        finally:
-            self.lock.release()
 
         return response
 
-    def set_abort_flag(self):
+    async def _send_command_handler(self):
         """
-        Sets self.abort_flag to True.
-
-        Used by the timer in Tello.send_command() to indicate to that a response
-
-        timeout has occurred.
-
-        """
-
-        self.abort_flag = True
-
-    def _send_command_handler(self):
-        """
-        start a while loop that sends 'command' to tello every 5 second
-        """
-        while True:
-            self.send_command('command')
-            time.sleep(30)
-
-    def _get_status_handler(self):
-        """Listen to responses from the Tello.
-
-        Runs as a thread, sets self.response to whatever the Tello last returned.
-
+        start a loop that sends 'command' to tello every keepalive_interval seconds, below the 15 s after which a
+        Tello without commands lands
         """
         while True:
             try:
-                self.response, ip = self.socket.recvfrom(3000)
-            except socket.error as exc:
-                logger.info("Caught exception socket.error : %s".format(exc))
+                await self.send_command('command')
+            except ConnectionError as e:
+                logger.info(f'Keepalive failed: {e}')
+            await asyncio.sleep(self.keepalive_interval)
+
+    async def close(self):
+        self._command_task.cancel()
+        try:
+            await self._command_task
+        except asyncio.CancelledError:
+            pass
 
     @property
     def get_status(self):
         return self.response
 
-    def takeoff(self):
+    async def takeoff(self):
         """
         Initiates take-off.
 
@@ -181,11 +95,11 @@ class CmdController:
 
         """
 
-        result = self.send_command('takeoff')
+        result = await self.send_command('takeoff', MAX_TIME_OUT)
         logger.info(f'Takeoff: {result}')
         return result
 
-    def set_speed(self, speed):
+    async def set_speed(self, speed):
         """
         Sets speed.
 
@@ -210,9 +124,9 @@ class CmdController:
         else:
             speed = int(round(speed * 27.7778))
 
-        return self.send_command('speed %s' % speed)
+        return await self.send_command('speed %s' % speed)
 
-    def rotate_cw(self, degrees):
+    async def rotate_cw(self, degrees):
         """
         Rotates clockwise.
 
@@ -224,12 +138,12 @@ class CmdController:
 
         """
 
-        result = self.send_command('cw %s' % degrees)
+        result = await self.send_command('cw %s' % degrees, MANOEUVRE_TIMEOUT)
         logger.info(f'rotate_cw: {result}')
 
         return result
 
-    def rotate_ccw(self, degrees):
+    async def rotate_ccw(self, degrees):
         """
         Rotates counter-clockwise.
 
@@ -240,12 +154,12 @@ class CmdController:
             str: Response from Tello, 'OK' or 'FALSE'.
 
         """
-        result = self.send_command('ccw %s' % degrees)
+        result = await self.send_command('ccw %s' % degrees, MANOEUVRE_TIMEOUT)
         logger.info(f'rotate_ccw: {result}')
 
         return result
 
-    def flip(self, direction):
+    async def flip(self, direction):
         """
         Flips.
 
@@ -257,7 +171,7 @@ class CmdController:
 
         """
 
-        return self.send_command('flip %s' % direction)
+        return await self.send_command('flip %s' % direction, MANOEUVRE_TIMEOUT)
 
     def get_response(self):
         """
@@ -270,14 +184,14 @@ class CmdController:
         response = self.response
         return response
 
-    def get_height(self):
+    async def get_height(self):
         """Returns height(dm) of tello.
 
         Returns:
             str: Height(dm) of tello.
 
         """
-        height = self.send_command('height?')
+        height = await self.send_command('height?')
 
         try:
             height = str(height)
@@ -288,7 +202,7 @@ class CmdController:
 
         return height
 
-    def get_battery(self):
+    async def get_battery(self):
         """Returns percent battery life remaining.
 
         Returns:
@@ -296,11 +210,11 @@ class CmdController:
 
         """
 
-        battery = self.send_command('battery?')
+        battery = await self.send_command('battery?')
 
         return str(battery)
 
-    def get_flight_time(self):
+    async def get_flight_time(self):
         """Returns the number of seconds elapsed during flight.
 
         Returns:
@@ -308,11 +222,11 @@ class CmdController:
 
         """
 
-        flight_time = self.send_command('time?')
+        flight_time = await self.send_command('time?')
 
         return str(flight_time)
 
-    def get_speed(self):
+    async def get_speed(self):
         """Returns the current speed.
 
         Returns:
@@ -320,11 +234,11 @@ class CmdController:
 
         """
 
-        speed = self.send_command('speed?')
+        speed = await self.send_command('speed?')
 
         return str(speed)
 
-    def land(self):
+    async def land(self):
         """Initiates landing.
 
         Returns:
@@ -332,11 +246,11 @@ class CmdController:
 
         """
 
-        result = self.send_command('land')
+        result = await self.send_command('land', MAX_TIME_OUT)
         logger.info(f'Land: {result}')
         return result
 
-    def move(self, direction, distance):
+    async def move(self, direction, distance):
         """Moves in a direction for a distance.
 
         This method expects meters or feet. The Tello API expects distances
@@ -361,12 +275,12 @@ class CmdController:
         else:
             distance = int(round(distance * 30))
 
-        result = self.send_command('%s %s' % (direction, distance))
+        result = await self.send_command('%s %s' % (direction, distance), MANOEUVRE_TIMEOUT)
         logger.info(f'move: {result}')
 
         return result
 
-    def move_backward(self, distance):
+    async def move_backward(self, distance):
         """Moves backward for a distance.
 
         See comments for Tello.move().
@@ -379,9 +293,9 @@ class CmdController:
 
         """
 
-        return self.move('back', distance)
+        return await self.move('back', distance)
 
-    def move_down(self, distance):
+    async def move_down(self, distance):
         """Moves down for a distance.
 
         See comments for Tello.move().
@@ -394,9 +308,9 @@ class CmdController:
 
         """
 
-        return self.move('down', distance)
+        return await self.move('down', distance)
 
-    def move_forward(self, distance):
+    async def move_forward(self, distance):
         """Moves forward for a distance.
 
         See comments for Tello.move().
@@ -408,9 +322,9 @@ class CmdController:
             str: Response from Tello, 'OK' or 'FALSE'.
 
         """
-        return self.move('forward', distance)
+        return await self.move('forward', distance)
 
-    def move_left(self, distance):
+    async def move_left(self, distance):
         """Moves left for a distance.
 
         See comments for Tello.move().
@@ -422,9 +336,9 @@ class CmdController:
             str: Response from Tello, 'OK' or 'FALSE'.
 
         """
-        return self.move('left', distance)
+        return await self.move('left', distance)
 
-    def move_right(self, distance):
+    async def move_right(self, distance):
         """Moves right for a distance.
 
         See comments for Tello.move().
@@ -433,9 +347,9 @@ class CmdController:
             distance (int): Distance to move.
 
         """
-        return self.move('right', distance)
+        return await self.move('right', distance)
 
-    def move_up(self, distance):
+    async def move_up(self, distance):
         """Moves up for a distance.
 
         See comments for Tello.move().
@@ -448,113 +362,237 @@ class CmdController:
 
         """
 
-        return self.move('up', distance)
+        return await self.move('up', distance)
 
-    def stop(self):
-        return self.send_command('stop')
+    async def stop(self):
+        return await self.send_command('stop')
 
-    def start_video(self):
-        self.send_command('command')
-        return self.send_command('streamon')
+    def rc(self, left_right, forward_back, up_down, yaw):
+        """
+        Sets the remote control channels. The Tello doesn't answer rc, it is sent without waiting.
 
-    def stop_video(self):
-        self.send_command('command')
-        return self.send_command('streamoff')
+        Args:
+            left_right (int): -100 to 100.
+            forward_back (int): -100 to 100.
+            up_down (int): -100 to 100.
+            yaw (int): -100 to 100.
+
+        """
+
+        self.protocol.send(f'rc {left_right} {forward_back} {up_down} {yaw}'.encode('utf-8'), self.tello_address)
+
+    async def start_video(self):
+        await self.send_command('command')
+        return await self.send_command('streamon')
+
+    async def stop_video(self):
+        await self.send_command('command')
+        return await self.send_command('streamoff')
 
 
 class DroneController:
-    def __init__(self, local_ip='', local_port=8889, tello_ip='192.168.10.1', tello_port=8889):
+    STATE_MAX_AGE = 1.0
+    MAX_RETRY_DELAY = 5.0
+
+    def __init__(self, local_ip='', local_port=8889, tello_ip='192.168.10.1', tello_port=8889, state_port=8890,
+                 video_port=VideoReceiver.VS_UDP_PORT, hls_outfile=VideoReceiver.OUTFILE, hls_time=1, hls_list_size=0):
+        self.local_address = (local_ip, local_port)
+        self.state_address = (local_ip, state_port)
         self.tello_address = (tello_ip, tello_port)
-        self.socket = self._create_socket(local_ip, local_port)
+        self.transport = None
+        self.state_transport = None
+
+        self._cmd_controller = None
+        self._state_protocol = None
+        self.position = DeadReckoning()
 
-        self._cmd_controller = CmdController(self.socket, self.tello_address)
+        self._video_receiver = VideoReceiver(*self.tello_address, hls_time=hls_time, hls_list_size=hls_list_size,
+                                             local_ip=local_ip, video_port=video_port, outfile=hls_outfile)
 
-        self._video_receiver = VideoReceiver(*self.tello_address)
+    async def connect(self):
+        """
+        Binds the command socket and starts talking to the Tello. Must be awaited from the running event loop.
+        """
+
+        loop = asyncio.get_running_loop()
+        sock = await self._create_socket(*self.local_address)
+        self.transport, protocol = await loop.create_datagram_endpoint(CommandProtocol, sock=sock)
+
+        sock = await self._create_socket(*self.state_address)
+        self.state_transport, self._state_protocol = await loop.create_datagram_endpoint(
+            lambda: StateProtocol(self.position.update), sock=sock
+        )
 
-    def _create_socket(self, local_ip, local_port):
+        self._cmd_controller = CmdController(protocol, self.tello_address)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._video_receiver.close)
+
+        if self._cmd_controller is not None:
+            await self._commands.close()
+            self._cmd_controller = None
+
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+        if self.state_transport is not None:
+            self.state_transport.close()
+            self.state_transport = None
+            self._state_protocol = None
+
+    def is_connected(self):
+        return self._cmd_controller is not None
+
+    @property
+    def _commands(self):
+        if self._cmd_controller is None:
+            raise ConnectionError('Drone is not connected')
+
+        return self._cmd_controller
+
+    async def _create_socket(self, local_ip, local_port):
+        delay = 0.5
         while True:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             try:
-                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
                 s.bind((local_ip, local_port))
                 return s
             except OSError as e:
-                logger.info(f'Error on creating socket. Retrying in 0.5s : {e}')
-                time.sleep(0.5)
+                s.close()
+                logger.info(f'Error on creating socket. Retrying in {delay}s : {e}')
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.MAX_RETRY_DELAY)
+
+    async def land(self):
+        return await self._commands.land()
 
-    def land(self):
-        self._cmd_controller.land()
+    async def takeoff(self):
+        # Positions are counted from the takeoff point.
+        self.position.reset()
+        return await self._commands.takeoff()
 
-    def takeoff(self):
-        self._cmd_controller.takeoff()
+    async def forward(self):
+        return await self._commands.move_forward(1)
 
-    def forward(self):
-        self._cmd_controller.move_forward(1)
+    async def backward(self):
+        return await self._commands.move_backward(1)
 
-    def backward(self):
-        self._cmd_controller.move_backward(1)
+    async def right(self):
+        return await self._commands.move_right(1)
 
-    def right(self):
-        self._cmd_controller.move_right(1)
+    async def left(self):
+        return await self._commands.move_left(1)
 
-    def left(self):
-        self._cmd_controller.move_left(1)
+    async def up(self):
+        return await self._commands.move_up(1)
 
-    def up(self):
-        self._cmd_controller.move_up(1)
+    async def down(self):
+        return await self._commands.move_down(1)
 
-    def down(self):
-        self._cmd_controller.move_down(1)
+    async def rotate_cw(self):
+        return await self._commands.rotate_cw(15)
 
-    def rotate_cw(self):
-        self._cmd_controller.rotate_cw(15)
+    async def rotate_ccw(self):
+        return await self._commands.rotate_ccw(15)
 
-    def rotate_ccw(self):
-        self._cmd_controller.rotate_ccw(15)
+    async def flip_f(self):
+        return await self._commands.flip('f')
 
-    def flip_f(self):
-        self._cmd_controller.flip('f')
+    async def flip_b(self):
+        return await self._commands.flip('b')
 
-    def flip_b(self):
-        self._cmd_controller.flip('b')
+    async def flip_l(self):
+        return await self._commands.flip('l')
 
-    def flip_l(self):
-        self._cmd_controller.flip('l')
+    async def flip_r(self):
+        return await self._commands.flip('r')
 
-    def flip_r(self):
-        self._cmd_controller.flip('r')
+    async def stop(self):
+        return await self._commands.stop()
 
-    def stop(self):
-        self._cmd_controller.stop()
+    def rc(self, left_right, forward_back, up_down, yaw):
+        self._commands.rc(left_right, forward_back, up_down, yaw)
 
-    def get_speed(self):
-        speed = self._cmd_controller.get_speed()
-        return self._correct_data(speed)
+    def get_state(self):
+        """
+        :return (DroneState): Latest state pushed by the Tello or None if the stream is silent.
+        """
+
+        state = self._state_protocol and self._state_protocol.state
+        if state is not None and state.age() < self.STATE_MAX_AGE:
+            return state
+
+        return None
+
+    async def get_speed(self):
+        """
+        :return: Current speed from the state stream or None if it is silent, 'speed?' only answers the configured
+            speed.
+        """
+
+        state = self.get_state()
+        if state is not None:
+            return state.speed
+
+        return None
 
-    def get_height(self):
-        height = self._cmd_controller.get_height()
+    async def get_height(self):
+        state = self.get_state()
+        if state is not None:
+            return state.height
+
+        height = await self._commands.get_height()
         return self._correct_data(height)
 
-    def get_battery(self):
-        battery = self._cmd_controller.get_battery()
+    async def get_battery(self):
+        state = self.get_state()
+        if state is not None:
+            return state.bat
+
+        battery = await self._commands.get_battery()
         return self._correct_data(battery)
 
-    def get_flight_time(self):
-        flight_time = self._cmd_controller.get_flight_time()
+    async def get_flight_time(self):
+        state = self.get_state()
+        if state is not None:
+            return state.time
+
+        flight_time = await self._commands.get_flight_time()
         return self._correct_data(flight_time)
 
+    def get_pose(self, timestamp):
+        """
+        :param timestamp: time.time() of the pose.
+        :return (dict): Dead-reckoned pose of the drone at that time or None if the state stream was silent.
+        """
+        return self.position.pose_at(timestamp)
+
     def _correct_data(self, data: str):
         if data:
-            match = re.search(r'(?P<number_data>[0-9]*)', data)
-            data = match and match.group('number_data')
+            match = re.search(r'(?P<number_data>[0-9]+)', data)
 
-            if data:
-                return data
+            if match:
+                return int(match.group('number_data'))
 
         return None
 
-    def start_video(self):
-        self._video_receiver.start_video()
-        return self._cmd_controller.start_video()
+    async def start_video(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._video_receiver.start_video)
+        return await self._commands.start_video()
+
+    async def stop_video(self):
+        self._video_receiver.stop_video()
+        return await self._commands.stop_video()
+
+    def add_raw_decoder(self, on_frame, width=960, height=720, fps=None):
+        return self._video_receiver.add_raw_decoder(on_frame, width, height, fps)
+
+    def add_video_listener(self, listener):
+        self._video_receiver.add_listener(listener)
+
+    def get_playlist_path(self):
+        return os.path.abspath(self._video_receiver.outfile)
 
-    def stop_video(self):
-        return self._cmd_controller.stop_video()
+    def get_video_stats(self):
+        return self._video_receiver.stats()
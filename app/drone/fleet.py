@@ -0,0 +1,43 @@
+import asyncio
+
+from app.drone.controller import DroneController
+
+
+class Fleet:
+    """
+    Registry of the drones handled by the backend, keyed by drone id.
+
+    Every drone gets its own DroneController, so its command socket, state receiver, tasks and video pipeline
+    are its own and a slow drone doesn't hold the others. Drones on the same host need their own local
+    interface (local_ip) or, behind a relay, their own ports.
+    """
+
+    def __init__(self, drones, hls_time=1, hls_list_size=0):
+        """
+        :param drones: {drone_id: DroneController keyword arguments}.
+        """
+        self.controllers = {}
+
+        for drone_id, options in drones.items():
+            options = dict(options)
+            options.setdefault('hls_outfile', f'./stream/{drone_id}/stream.m3u8')
+
+            self.controllers[drone_id] = DroneController(hls_time=hls_time, hls_list_size=hls_list_size, **options)
+
+    def __getitem__(self, drone_id):
+        return self.controllers[drone_id]
+
+    def __contains__(self, drone_id):
+        return drone_id in self.controllers
+
+    def __iter__(self):
+        return iter(self.controllers)
+
+    def items(self):
+        return self.controllers.items()
+
+    async def connect(self):
+        await asyncio.gather(*(controller.connect() for controller in self.controllers.values()))
+
+    async def close(self):
+        await asyncio.gather(*(controller.close() for controller in self.controllers.values()))
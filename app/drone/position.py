@@ -0,0 +1,83 @@
+import bisect
+import threading
+import time
+
+
+class DeadReckoning:
+    """
+    Position of the drone integrated from the ground speeds of the state stream, in metres from the takeoff
+    point along the vgx and vgy axes of the Tello. It drifts over a flight, which is fine to group the detections
+    of a place together, not to navigate.
+
+    The poses of the last history seconds are kept by wall clock time, so a detection can be matched to where
+    the drone was when it came out of the detector, from any thread.
+    """
+
+    # Seconds of a state stream gap integrated at most, the drone is assumed still over longer gaps.
+    MAX_STEP = 0.5
+    # A pose further than this from the asked time doesn't stand for it.
+    MAX_GAP = 1.0
+
+    def __init__(self, history=300):
+        self.history = history
+
+        self.x = 0.0
+        self.y = 0.0
+        self._last_received_at = None
+
+        self._times = []
+        self._poses = []
+        self._lock = threading.Lock()
+
+    def reset(self):
+        self.x = 0.0
+        self.y = 0.0
+
+    def update(self, state, at=None):
+        """
+        :param state: DroneState just received.
+        :param at: time.time() of the reception, defaults to now.
+        """
+        at = time.time() if at is None else at
+
+        if self._last_received_at is not None:
+            # The vg* fields are in dm/s.
+            step = min(state.received_at - self._last_received_at, self.MAX_STEP)
+            self.x += state.vgx * 0.1 * step
+            self.y += state.vgy * 0.1 * step
+        self._last_received_at = state.received_at
+
+        pose = {
+            'x': round(self.x, 2),
+            'y': round(self.y, 2),
+            'height': state.h / 100,
+            'yaw': state.yaw,
+            'pitch': state.pitch,
+            'roll': state.roll,
+        }
+
+        with self._lock:
+            self._times.append(at)
+            self._poses.append(pose)
+
+            expired = bisect.bisect_left(self._times, at - self.history)
+            if expired:
+                del self._times[:expired]
+                del self._poses[:expired]
+
+    def pose_at(self, timestamp):
+        """
+        :param timestamp: time.time() of the pose.
+        :return (dict): The nearest pose {x, y, height, yaw, pitch, roll} or None if there isn't one close enough.
+        """
+        with self._lock:
+            index = bisect.bisect_left(self._times, timestamp)
+            candidates = [i for i in (index - 1, index) if 0 <= i < len(self._times)]
+            if not candidates:
+                return None
+
+            nearest = min(candidates, key=lambda i: abs(self._times[i] - timestamp))
+            if abs(self._times[nearest] - timestamp) > self.MAX_GAP:
+                return None
+
+            return self._poses[nearest]
@@ -0,0 +1,102 @@
+import asyncio
+import collections
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CommandProtocol(asyncio.DatagramProtocol):
+    """
+    Datagram protocol for the Tello command socket.
+
+    The Tello answers commands in the order it receives them, so every command gets a future that is queued
+    and resolved by the next reply that comes back on the socket. A command that timed out may still be answered
+    later, the next reply within late_reply_timeout is then taken as its reply and dropped.
+
+    A reply that is lost for good makes the next reply be dropped as late, and so its command time out. That
+    timeout doesn't expect a late reply again, the channel is back in step after one command.
+    """
+
+    def __init__(self, late_reply_timeout=1.0):
+        """
+        :param late_reply_timeout: Seconds after its timeout the reply of a command is still expected for.
+        """
+        self.transport = None
+        self.late_reply_timeout = late_reply_timeout
+        self._waiters = collections.deque()
+        # Deadlines of the replies of the timed out commands, oldest first.
+        self._late_replies = collections.deque()
+        self.late_replies_dropped = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        now = asyncio.get_running_loop().time()
+        while self._late_replies and self._late_replies[0] < now:
+            self._late_replies.popleft()
+
+        if self._late_replies:
+            self._late_replies.popleft()
+            self.late_replies_dropped += 1
+            logger.debug(f'Dropped late response from {addr}: {data}')
+            return
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(data)
+                return
+
+        logger.debug(f'Dropped unexpected response from {addr}: {data}')
+
+    def error_received(self, exc):
+        logger.info(f'Caught exception socket.error : {exc}')
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(ConnectionError('Command socket closed'))
+
+    def send(self, data, address):
+        """
+        Send a datagram without waiting for a reply, for the commands the Tello doesn't answer.
+        """
+
+        if self.transport is None:
+            raise ConnectionError('Command socket is not connected')
+
+        self.transport.sendto(data, address)
+
+    async def request(self, data, address, timeout):
+        """
+        Send a datagram and wait for the reply.
+
+        :param data: Bytes to send.
+        :param address: Address of the Tello.
+        :param timeout: Seconds to wait for the reply.
+        :return (bytes): Reply of the Tello.
+        :raises asyncio.TimeoutError: If no reply arrives in time.
+        """
+
+        if self.transport is None:
+            raise ConnectionError('Command socket is not connected')
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        dropped = self.late_replies_dropped
+
+        self.transport.sendto(data, address)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                # Timed out or cancelled, the Tello may still answer and its reply isn't the next command's. Unless
+                # a reply was dropped as late meanwhile: it may have been this command's own.
+                if self.late_replies_dropped == dropped:
+                    self._late_replies.append(loop.time() + self.late_reply_timeout)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RcSender:
+    """
+    Streams the latest joystick setpoint of a drone as `rc a b c d` at a fixed rate, without waiting for replies.
+
+    The Tello keeps flying on the last rc it got, so a setpoint not refreshed for deadman seconds is replaced by a
+    zero one: the drone hovers when the client freezes or goes away. A zero setpoint is sent for deadman seconds
+    of ticks, so a lost datagram doesn't leave the drone moving, before the sender goes idle.
+    """
+
+    ZERO = (0, 0, 0, 0)
+
+    def __init__(self, drone_controller, rate=20, deadman=0.5):
+        """
+        :param rate: Setpoints sent per second.
+        :param deadman: Seconds without a new setpoint before zeroing it.
+        """
+        self.dc = drone_controller
+        self.interval = 1 / rate
+        self.deadman = deadman
+        self.zero_repeats = max(1, round(rate * deadman))
+
+        self.setpoint = None
+        self.updated_at = 0
+        self._zeros_sent = 0
+
+        self._task = None
+
+        self.sent = 0
+        self.deadman_trips = 0
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def set(self, left_right, forward_back, up_down, yaw):
+        """
+        Axes from -100 to 100, out of range values are clamped.
+        """
+        self.setpoint = tuple(max(-100, min(100, int(axis))) for axis in (left_right, forward_back, up_down, yaw))
+        self.updated_at = asyncio.get_running_loop().time()
+
+    def zero(self):
+        if self.setpoint is not None:
+            self.set(*self.ZERO)
+
+    def stats(self):
+        return {'setpoint': self.setpoint, 'sent': self.sent, 'deadman_trips': self.deadman_trips}
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+
+        while True:
+            if self.setpoint is not None:
+                setpoint = self.setpoint
+                if setpoint != self.ZERO and loop.time() - self.updated_at > self.deadman:
+                    logger.info(f'No rc setpoint for {self.deadman}s, hovering')
+                    setpoint = self.setpoint = self.ZERO
+                    self.deadman_trips += 1
+
+                try:
+                    self.dc.rc(*setpoint)
+                    self.sent += 1
+                except ConnectionError as e:
+                    logger.info(f'rc not sent: {e}')
+
+                # Idle once the drone got its zero setpoint enough times, until the next one.
+                if setpoint != self.ZERO:
+                    self._zeros_sent = 0
+                else:
+                    self._zeros_sent += 1
+                    if self._zeros_sent >= self.zero_repeats:
+                        self.setpoint = None
+                        self._zeros_sent = 0
+
+            # Scheduled on a fixed grid so the rate doesn't drift with the time spent sending.
+            deadline = max(deadline + self.interval, loop.time())
+            await asyncio.sleep(deadline - loop.time())
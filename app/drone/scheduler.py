@@ -0,0 +1,158 @@
+import asyncio
+import collections
+import logging
+
+from app.settings import Commands
+
+logger = logging.getLogger(__name__)
+
+
+class CommandDropped(Exception):
+    pass
+
+
+class CommandScheduler:
+    """
+    Queue of the /command messages of a drone, sent to the Tello one at a time and no faster than interval.
+
+    A movement already waiting in the queue absorbs the same movement sent again, so a burst of FORWARD from a
+    joystick costs one command. STOP and LAND jump the queue and drop the movements still waiting.
+    """
+
+    METHODS = {
+        Commands.STOP: 'stop',
+        Commands.LAND: 'land',
+        Commands.TAKEOFF: 'takeoff',
+        Commands.FORWARD: 'forward',
+        Commands.BACKWARDS: 'backward',
+        Commands.LEFT: 'left',
+        Commands.RIGHT: 'right',
+        Commands.UP: 'up',
+        Commands.DOWN: 'down',
+        Commands.R_CW: 'rotate_cw',
+        Commands.R_CCW: 'rotate_ccw',
+        Commands.F_F: 'flip_f',
+        Commands.F_B: 'flip_b',
+        Commands.F_L: 'flip_l',
+        Commands.F_R: 'flip_r',
+        Commands.START_VIDEO: 'start_video',
+        Commands.STOP_VIDEO: 'stop_video',
+    }
+    PRIORITY = (Commands.STOP, Commands.LAND)
+    COALESCED = (Commands.FORWARD, Commands.BACKWARDS, Commands.LEFT, Commands.RIGHT, Commands.UP, Commands.DOWN,
+                 Commands.R_CW, Commands.R_CCW)
+
+    def __init__(self, drone_controller, interval=0.1):
+        """
+        :param interval: Minimum seconds between two commands sent to the Tello.
+        """
+        self.dc = drone_controller
+        self.interval = interval
+
+        self._pending = collections.deque()
+        self._wakeup = None
+        self._task = None
+        self._last_sent = 0
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        while self._pending:
+            _, future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(CommandDropped('Command scheduler stopped'))
+
+    def submit(self, command):
+        """
+        :param command: One of the Commands.
+        :return (asyncio.Future, bool): Future of the response of the Tello and whether the command was merged into
+            one already waiting.
+        :raises ValueError: If the command is unknown.
+        """
+
+        if command not in self.METHODS:
+            raise ValueError(f'Unknown command {command}')
+
+        self.submitted += 1
+
+        if command in self.COALESCED:
+            for pending, future in self._pending:
+                if pending == command:
+                    self.coalesced += 1
+                    return future, True
+
+        future = asyncio.get_running_loop().create_future()
+
+        if command in self.PRIORITY:
+            self._drop_movements(command)
+
+            # Behind the other priority commands only, a STOP then LAND burst keeps its order.
+            index = 0
+            while index < len(self._pending) and self._pending[index][0] in self.PRIORITY:
+                index += 1
+            self._pending.insert(index, (command, future))
+        else:
+            self._pending.append((command, future))
+
+        self._wakeup.set()
+        return future, False
+
+    def stats(self):
+        return {
+            'depth': len(self._pending),
+            'submitted': self.submitted,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+        }
+
+    def _drop_movements(self, command):
+        kept = collections.deque()
+
+        for pending, future in self._pending:
+            if pending in self.COALESCED:
+                self.dropped += 1
+                future.set_exception(CommandDropped(f'Superseded by {command}'))
+            else:
+                kept.append((pending, future))
+
+        self._pending = kept
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # The command is only picked once the rate allows it, a STOP coming meanwhile still goes first.
+            delay = self._last_sent + self.interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            command, future = self._pending.popleft()
+            try:
+                result = await getattr(self.dc, self.METHODS[command])()
+            except Exception as e:
+                logger.info(f'Command {command} failed: {e}')
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                self._last_sent = loop.time()
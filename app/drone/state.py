@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DroneState:
+    """
+    Snapshot of one Tello state datagram, e.g.
+    b'pitch:0;roll:0;yaw:0;vgx:0;vgy:0;vgz:0;templ:60;temph:62;tof:10;h:0;bat:87;baro:120.33;time:0;agx:1.00;...;\\r\\n'
+    """
+
+    FIELDS = {
+        'pitch': int,
+        'roll': int,
+        'yaw': int,
+        'vgx': int,
+        'vgy': int,
+        'vgz': int,
+        'templ': int,
+        'temph': int,
+        'tof': int,
+        'h': int,
+        'bat': int,
+        'baro': float,
+        'time': int,
+        'agx': float,
+        'agy': float,
+        'agz': float,
+    }
+
+    __slots__ = tuple(FIELDS) + ('received_at', )
+
+    def __init__(self, received_at=None):
+        for name, cast in self.FIELDS.items():
+            setattr(self, name, cast())
+
+        self.received_at = time.monotonic() if received_at is None else received_at
+
+    @classmethod
+    def parse(cls, data, received_at=None):
+        """
+        :param data: Raw state datagram.
+        :param received_at: time.monotonic() of the reception, defaults to now.
+        :return (DroneState): Parsed snapshot, unknown fields (e.g. mission pad ones) are ignored.
+        """
+
+        state = cls(received_at)
+
+        for item in data.decode('ascii').split(';'):
+            key, _, value = item.strip().partition(':')
+            cast = cls.FIELDS.get(key)
+            if cast is not None:
+                setattr(state, key, cast(value))
+
+        return state
+
+    def age(self):
+        return time.monotonic() - self.received_at
+
+    @property
+    def height(self):
+        """Height in dm, same unit as the 'height?' command."""
+        return self.h // 10
+
+    @property
+    def speed(self):
+        """Ground speed in cm/s, the vg* fields are reported in dm/s."""
+        return int(round(math.sqrt(self.vgx ** 2 + self.vgy ** 2 + self.vgz ** 2) * 10))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+class StateProtocol(asyncio.DatagramProtocol):
+    """Receives the state datagrams the Tello pushes to port 8890 and keeps the latest one."""
+
+    def __init__(self, on_state=None):
+        """
+        :param on_state: Called with every new DroneState.
+        """
+        self.transport = None
+        self.state = None
+        self.on_state = on_state
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            self.state = DroneState.parse(data)
+        except (UnicodeDecodeError, ValueError) as e:
+            logger.debug(f'Malformed state datagram from {addr}: {e}')
+            return
+
+        if self.on_state is not None:
+            self.on_state(self.state)
+
+    def error_received(self, exc):
+        logger.info(f'Caught exception socket.error : {exc}')
+
+    def connection_lost(self, exc):
+        self.transport = None
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import logging
+
+from app import wire
+from app.connections import Connections
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryPoller:
+    """
+    Samples the drone status once per interval and broadcasts the same serialized frame to every subscriber.
+
+    The drone is only queried while there is at least one subscriber. Subscribers of the binary subprotocol get
+    a full frame when they join and then only the fields that changed.
+    """
+
+    def __init__(self, drone_controller, interval=2):
+        self.dc = drone_controller
+        self.interval = interval
+        self.connections = Connections()
+
+        self.snapshot = None
+        self.frame = None
+        self.binary_frame = None
+
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def subscribe(self, websocket):
+        self.connections.register(websocket)
+
+        if self.snapshot is None:
+            return
+
+        if websocket.ws_protocol == wire.PROTOCOL:
+            await websocket.send_bytes(wire.encode_telemetry(self.snapshot))
+        else:
+            await websocket.send_str(self.frame)
+
+    def unsubscribe(self, websocket):
+        self.connections.unregister(websocket)
+
+    async def sample(self):
+        return {
+            'battery': await self.dc.get_battery(),
+            'height': await self.dc.get_height(),
+            'speed': await self.dc.get_speed(),
+            'flight_time': await self.dc.get_flight_time()
+        }
+
+    async def broadcast(self, frame, binary_frame=None):
+        websockets = list(self.connections)
+        results = await asyncio.gather(*(
+            ws.send_bytes(binary_frame) if ws.ws_protocol == wire.PROTOCOL else ws.send_str(frame)
+            for ws in websockets
+        ), return_exceptions=True)
+
+        for websocket, result in zip(websockets, results):
+            if isinstance(result, Exception):
+                logger.info(f'Dropping status subscriber: {result}')
+                self.unsubscribe(websocket)
+
+    async def _run(self):
+        while True:
+            if self.connections:
+                try:
+                    snapshot = await self.sample()
+                    # Every binary subscriber holds the previous snapshot: it got it in full when it joined and
+                    # the deltas since. One delta serves them all.
+                    self.binary_frame = wire.encode_telemetry(snapshot, self.snapshot)
+                    self.snapshot = snapshot
+                    self.frame = json.dumps(self.snapshot)
+                    await self.broadcast(self.frame, self.binary_frame)
+                except Exception as e:
+                    logger.error(e)
+
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,463 @@
+import collections
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+
+import ffmpeg
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NAL_START_CODE = b'\x00\x00\x01'
+# IDR slice, sequence parameter set and picture parameter set.
+KEYFRAME_NAL_TYPES = frozenset((5, 7, 8))
+
+
+def nal_unit_types(frame):
+    """
+    :param frame: H.264 Annex B byte stream.
+    :return (generator): nal_unit_type of every NAL unit of the frame.
+    """
+
+    index = frame.find(NAL_START_CODE)
+    while index != -1 and index + 3 < len(frame):
+        yield frame[index + 3] & 0x1f
+        index = frame.find(NAL_START_CODE, index + 3)
+
+
+def is_keyframe(frame):
+    return any(nal_type in KEYFRAME_NAL_TYPES for nal_type in nal_unit_types(frame))
+
+
+class FrameAssembler:
+    """
+    Reassembles the H.264 frames of the Tello video stream in a preallocated buffer.
+
+    The Tello splits every frame in datagrams of PACKET_SIZE bytes, a shorter datagram ends the frame.
+    Datagrams are received with recv_into straight at the end of the frame being built, so no bytes object
+    is allocated or concatenated per packet.
+    """
+
+    PACKET_SIZE = 1460
+    MAX_DATAGRAM_SIZE = 2048
+
+    def __init__(self, capacity=256 * 1024):
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.size = 0
+
+        self.packets = 0
+        self.frames = 0
+        self.overflows = 0
+
+    def receive(self, sock):
+        """
+        Receives one datagram from the socket.
+
+        :param sock: Bound datagram socket.
+        :return (memoryview): The complete frame, only valid until the next call, or None if the frame goes on.
+        """
+
+        if self.size + self.MAX_DATAGRAM_SIZE > len(self.buffer):
+            # The frame doesn't fit the buffer, drop it instead of growing forever on a lost end of frame.
+            logger.info(f'Dropped video frame larger than {len(self.buffer)} bytes')
+            self.overflows += 1
+            self.size = 0
+
+        nbytes = sock.recv_into(self.view[self.size:self.size + self.MAX_DATAGRAM_SIZE])
+        self.size += nbytes
+        self.packets += 1
+
+        if nbytes == self.PACKET_SIZE:
+            return None
+
+        frame = self.view[:self.size]
+        self.size = 0
+        self.frames += 1
+
+        return frame
+
+
+class FrameQueue:
+    """
+    Bounded, thread safe queue of H.264 frames between two pipeline stages.
+
+    When it is full the oldest non keyframe is dropped, so a slow consumer loses predicted frames
+    before it loses the frames it needs to resynchronize.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._frames = collections.deque()
+        self._not_empty = threading.Condition()
+
+        self.put_count = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def depth(self):
+        return len(self._frames)
+
+    def put(self, frame, keyframe=False):
+        with self._not_empty:
+            if len(self._frames) >= self.maxsize:
+                self._drop_one()
+
+            self._frames.append((frame, keyframe))
+            self.put_count += 1
+            self._not_empty.notify()
+
+    def get(self, timeout=None):
+        """
+        :return (tuple): (frame, keyframe) or None if the queue stayed empty for timeout seconds.
+        """
+
+        with self._not_empty:
+            if not self._frames and not self._not_empty.wait(timeout):
+                return None
+
+            return self._frames.popleft()
+
+    def clear(self):
+        with self._not_empty:
+            self.dropped += len(self._frames)
+            self._frames.clear()
+
+    def _drop_one(self):
+        for index, (_, keyframe) in enumerate(self._frames):
+            if not keyframe:
+                del self._frames[index]
+                break
+        else:
+            self._frames.popleft()
+
+        self.dropped += 1
+
+
+class FfmpegWriter:
+    """
+    Pipeline stage feeding the frames of a FrameQueue to the stdin of an ffmpeg process.
+
+    If ffmpeg exits or stalls into a broken pipe it is started again, and frames are skipped until the next
+    keyframe so the new process can decode the stream. The receiving socket is never touched.
+    """
+
+    def __init__(self, command, queue, name='ffmpeg-writer'):
+        self.command = command
+        self.queue = queue
+        self.name = name
+        self.stopped = False
+
+        self.proc = None
+        self.written = 0
+        self.skipped = 0
+        self.restarts = 0
+
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the stage, after waiting for the end of a previous run that is being stopped. Blocks for it.
+        """
+        if self.is_alive():
+            if not self.stopped:
+                return
+            self._thread.join()
+
+        self.stopped = False
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.stopped = True
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self):
+        return {
+            'depth': self.queue.depth,
+            'queued': self.queue.put_count,
+            'dropped': self.queue.dropped,
+            'written': self.written,
+            'skipped': self.skipped,
+            'restarts': self.restarts,
+        }
+
+    def _run(self):
+        waiting_keyframe = True
+
+        while not self.stopped:
+            item = self.queue.get(timeout=0.5)
+            if item is None:
+                continue
+
+            frame, keyframe = item
+
+            if self.proc is None or self.proc.poll() is not None:
+                self._start_process()
+                waiting_keyframe = True
+
+            if waiting_keyframe and not keyframe:
+                self.skipped += 1
+                continue
+            waiting_keyframe = False
+
+            try:
+                self.proc.stdin.write(frame)
+                self.proc.stdin.flush()
+                self.written += 1
+            except (BrokenPipeError, ValueError, OSError) as exc:
+                logger.error(f'ffmpeg stdin closed, restarting it : {exc}')
+                self._stop_process()
+
+        self._stop_process()
+
+    def _popen(self):
+        return subprocess.Popen(self.command, stdin=subprocess.PIPE)
+
+    def _start_process(self):
+        if self.proc is not None:
+            self.restarts += 1
+            self._stop_process()
+
+        self.proc = self._popen()
+
+    def _stop_process(self):
+        if self.proc is None:
+            return
+
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        self.proc.terminate()
+        self.proc.wait()
+        self.proc = None
+
+
+class RawFrameDecoder(FfmpegWriter):
+    """
+    Pipeline stage decoding the H.264 frames of a FrameQueue to RGB arrays in process.
+
+    ffmpeg writes rgb24 rawvideo to its stdout, which is read frame by frame into NumPy arrays handed to
+    on_frame, with the time.time() they were decoded at, so no image file is written or decoded again.
+    """
+
+    def __init__(self, queue, on_frame, width=960, height=720, fps=None, name='raw-decoder'):
+        stream = ffmpeg.input('pipe:0', format='h264', fflags='nobuffer', flags='low_delay')
+        if fps:
+            stream = stream.filter('fps', fps=fps)
+        command = (
+            stream
+                .output('pipe:1', format='rawvideo', pix_fmt='rgb24', s=f'{width}x{height}')
+                .compile()
+        )
+
+        super().__init__(command, queue, name=name)
+        self.on_frame = on_frame
+        self.width = width
+        self.height = height
+
+        self.decoded = 0
+
+    def stats(self):
+        stats = super().stats()
+        stats['decoded'] = self.decoded
+        return stats
+
+    def _popen(self):
+        proc = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        threading.Thread(target=self._read_frames, args=(proc.stdout, ), name=f'{self.name}-reader', daemon=True).start()
+        return proc
+
+    def _read_frames(self, stdout):
+        frame_size = self.width * self.height * 3
+
+        while True:
+            buffer = bytearray(frame_size)
+            view = memoryview(buffer)
+
+            read = 0
+            while read < frame_size:
+                nbytes = stdout.readinto(view[read:])
+                if not nbytes:
+                    return
+                read += nbytes
+
+            decoded_at = time.time()
+            self.decoded += 1
+            try:
+                self.on_frame(np.frombuffer(buffer, dtype=np.uint8).reshape(self.height, self.width, 3), decoded_at)
+            except Exception as e:
+                logger.error(e)
+
+
+class HlsWriter(FfmpegWriter):
+    """
+    Pipeline stage writing the stream as HLS.
+
+    Every ffmpeg process numbers its segments from the time it started in milliseconds. A segment lasts at least
+    a millisecond, so a restarted ffmpeg, or app, never reuses the name of a segment a client may have cached,
+    and the media sequence of the playlist only grows.
+    """
+
+    def __init__(self, outfile, queue, hls_time=1, hls_list_size=0, name='hls-writer'):
+        self.outfile = outfile
+        self.hls_options = {'hls_time': hls_time, 'hls_list_size': hls_list_size}
+        if hls_list_size:
+            self.hls_options['hls_flags'] = 'delete_segments'
+
+        super().__init__(self._compile(), queue, name=name)
+
+    def _compile(self):
+        return (
+            ffmpeg
+                .input('pipe:0')
+                .output(self.outfile, format='hls', start_number=int(time.time() * 1000), **self.hls_options)
+                .overwrite_output()
+                .compile()
+        )
+
+    def _popen(self):
+        self.command = self._compile()
+        return super()._popen()
+
+
+class VideoReceiver:
+    VS_UDP_IP = '0.0.0.0'
+    VS_UDP_PORT = 11111
+    OUTFILE = "./stream/stream.m3u8"
+
+    def __init__(self, tello_ip, tello_port, queue_size=128, hls_time=1, hls_list_size=0, local_ip='',
+                 video_port=None, outfile=None):
+        """
+        :param video_port: Local port the Tello streams to, VS_UDP_PORT by default.
+        :param outfile: HLS playlist written by ffmpeg, OUTFILE by default.
+        :param hls_time: Duration of the HLS segments in seconds.
+        :param hls_list_size: Number of segments kept in the playlist, older ones are deleted from the disk.
+            0 keeps every segment of the flight.
+        """
+        self.tello_address = (tello_ip, tello_port)
+        self.stopped = False
+
+        # Socket for receiving video stream, bound by start_video.
+        self.video_address = (local_ip, self.VS_UDP_PORT if video_port is None else video_port)
+        self.socket_video = None
+
+        self.outfile = self.OUTFILE if outfile is None else outfile
+        os.makedirs(os.path.dirname(self.outfile), exist_ok=True)
+
+        self.assembler = FrameAssembler()
+
+        self.hls_writer = HlsWriter(self.outfile, FrameQueue(queue_size), hls_time, hls_list_size)
+        self.writers = [self.hls_writer]
+        self.listeners = []
+
+        self.receive_raw_video_thread = None
+
+    def add_raw_decoder(self, on_frame, width=960, height=720, fps=None, queue_size=32):
+        """
+        Decodes the stream to RGB arrays, next to the HLS output.
+
+        :param on_frame: Called from the decoder thread with every decoded (height, width, 3) uint8 array and the
+            time.time() it was decoded at.
+        :return (RawFrameDecoder): The new pipeline stage.
+        """
+
+        decoder = RawFrameDecoder(FrameQueue(queue_size), on_frame, width, height, fps)
+        self.writers.append(decoder)
+
+        if self.receive_raw_video_thread is not None and self.receive_raw_video_thread.is_alive():
+            decoder.start()
+
+        return decoder
+
+    def add_listener(self, listener):
+        """
+        :param listener: Called from the receiving thread with every frame (bytes) and whether it's a keyframe.
+            It must not block.
+        """
+        self.listeners.append(listener)
+
+    def _receive_raw_data_handler(self):
+        while not self.stopped:
+            try:
+                frame = self.assembler.receive(self.socket_video)
+            except socket.timeout:
+                continue
+            except socket.error as exc:
+                logger.error("Caught exception socket.error : {}".format(exc))
+                continue
+
+            if frame is None:
+                continue
+
+            frame = bytes(frame)
+            keyframe = is_keyframe(frame)
+            for writer in self.writers:
+                writer.queue.put(frame, keyframe)
+            for listener in self.listeners:
+                listener(frame, keyframe)
+
+    def start_video(self):
+        """
+        Starts receiving the video, after waiting for the threads of a previous stop_video to end. Blocks for it.
+        """
+        if self.receive_raw_video_thread is not None and self.receive_raw_video_thread.is_alive():
+            if not self.stopped:
+                return
+            self.receive_raw_video_thread.join()
+
+        if self.socket_video is None:
+            self.socket_video = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket_video.bind(self.video_address)
+            self.socket_video.settimeout(0.5)
+
+        self.stopped = False
+
+        for writer in self.writers:
+            writer.start()
+
+        self.receive_raw_video_thread = threading.Thread(target=self._receive_raw_data_handler, daemon=True)
+        self.receive_raw_video_thread.start()
+
+    def stop_video(self):
+        self.stopped = True
+
+        for writer in self.writers:
+            writer.stop()
+
+    def close(self, timeout=5.0):
+        """
+        Stops the video and waits for its threads, and so its ffmpeg processes, to end. Blocks.
+        """
+        self.stop_video()
+
+        for writer in self.writers:
+            writer.join(timeout)
+        if self.receive_raw_video_thread is not None:
+            self.receive_raw_video_thread.join(timeout)
+            self.receive_raw_video_thread = None
+
+        if self.socket_video is not None:
+            self.socket_video.close()
+            self.socket_video = None
+
+    def stats(self):
+        return {
+            'packets': self.assembler.packets,
+            'frames': self.assembler.frames,
+            'overflows': self.assembler.overflows,
+            'writers': {writer.name: writer.stats() for writer in self.writers},
+        }
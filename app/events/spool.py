@@ -0,0 +1,157 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct('>I')
+# Segment and offset of the first record that was not acknowledged yet.
+ACK_INDEX = struct.Struct('>QQ')
+
+
+class EventSpool:
+    """
+    Append-only, segmented on-disk log of outbound event payloads.
+
+    Records are length prefixed and appended to numbered segment files, a new segment is started once the
+    current one reaches segment_size. The position of the first unacknowledged record lives in a small
+    mmap'd index file, so the spool drains in order after a restart. Segments before that position are
+    deleted. Only the records being read are held in memory.
+    """
+
+    INDEX_FILE = 'acked.idx'
+    SEGMENT_SUFFIX = '.log'
+
+    def __init__(self, directory, segment_size=16 * 1024 * 1024, fsync=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._index_file, self._index = self._open_index()
+
+        segments = self._segments()
+        self._write_segment = segments[-1] if segments else self.acked_position[0]
+        self._writer = self._open_writer(self._write_segment)
+
+    @property
+    def acked_position(self):
+        return ACK_INDEX.unpack_from(self._index)
+
+    def append(self, payload):
+        with self._lock:
+            if self._writer.tell() >= self.segment_size:
+                self._writer.close()
+                self._write_segment += 1
+                self._writer = self._open_writer(self._write_segment)
+
+            self._writer.write(RECORD_HEADER.pack(len(payload)))
+            self._writer.write(payload)
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+
+    def peek(self, max_records):
+        """
+        Reads the oldest unacknowledged records, without consuming them.
+
+        :param max_records: Maximum number of records to read.
+        :return (tuple): List of payloads and the position to acknowledge once they are delivered.
+        """
+        with self._lock:
+            segment, offset = self.acked_position
+            records = []
+
+            while len(records) < max_records:
+                path = self._segment_path(segment)
+                if not os.path.exists(path):
+                    break
+
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    while len(records) < max_records:
+                        header = f.read(RECORD_HEADER.size)
+                        if len(header) < RECORD_HEADER.size:
+                            break
+                        size, = RECORD_HEADER.unpack(header)
+                        records.append(f.read(size))
+                        offset = f.tell()
+
+                if len(records) < max_records and segment < self._write_segment:
+                    segment, offset = segment + 1, 0
+                else:
+                    break
+
+            return records, (segment, offset)
+
+    def ack(self, position):
+        """
+        Marks every record before position as delivered and deletes the segments that are fully acknowledged.
+        """
+        with self._lock:
+            ACK_INDEX.pack_into(self._index, 0, *position)
+            self._index.flush()
+
+            for segment in self._segments():
+                if segment >= position[0]:
+                    break
+                os.remove(self._segment_path(segment))
+
+    def is_empty(self):
+        with self._lock:
+            segment, offset = self.acked_position
+            return segment == self._write_segment and offset >= self._writer.tell()
+
+    def close(self):
+        with self._lock:
+            self._writer.close()
+            self._index.close()
+            self._index_file.close()
+
+    def _open_index(self):
+        path = os.path.join(self.directory, self.INDEX_FILE)
+        index_file = open(path, 'a+b')
+        if os.path.getsize(path) < ACK_INDEX.size:
+            index_file.truncate(ACK_INDEX.size)
+
+        return index_file, mmap.mmap(index_file.fileno(), ACK_INDEX.size)
+
+    def _open_writer(self, segment):
+        path = self._segment_path(segment)
+        self._truncate_partial_record(path)
+        return open(path, 'ab')
+
+    def _truncate_partial_record(self, path):
+        # A crash in the middle of an append leaves an incomplete record at the end of the last segment.
+        if not os.path.exists(path):
+            return
+
+        size = os.path.getsize(path)
+        with open(path, 'r+b') as f:
+            end = 0
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                record_end = end + RECORD_HEADER.size + RECORD_HEADER.unpack(header)[0]
+                if record_end > size:
+                    break
+                f.seek(record_end)
+                end = record_end
+
+            if end < size:
+                logger.info(f'Truncating partial record at the end of {path}')
+                f.truncate(end)
+
+    def _segments(self):
+        return sorted(
+            int(name[:-len(self.SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(self.SEGMENT_SUFFIX)
+        )
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f'{segment:010d}{self.SEGMENT_SUFFIX}')
@@ -0,0 +1,268 @@
+import asyncio
+import base64
+import json
+import logging
+import struct
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Sizes of the JSON encoded objects and of the thumbnail of a spooled event, followed by the objects, the
+# thumbnail and the image bytes.
+EVENT_HEADER = struct.Struct('>II')
+
+# Client errors worth sending the batch again for, any other 4xx rejects it for good.
+RETRIED_STATUSES = (408, 429)
+
+
+class EventsRejected(Exception):
+    pass
+
+
+def _json_default(value):
+    # Detections may hold NumPy scalars and arrays.
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(value):
+    return json.dumps(value, default=_json_default)
+
+
+def encode_event(event):
+    objects = dumps(event['objects']).encode('utf-8')
+    thumbnail = event['thumbnail'] or b''
+    return EVENT_HEADER.pack(len(objects), len(thumbnail)) + objects + thumbnail + event['image']
+
+
+def decode_event(payload):
+    objects_size, thumbnail_size = EVENT_HEADER.unpack_from(payload)
+    start = EVENT_HEADER.size
+    objects = json.loads(payload[start:start + objects_size])
+    start += objects_size
+    thumbnail = payload[start:start + thumbnail_size] or None
+    return {'objects': objects, 'image': payload[start + thumbnail_size:], 'thumbnail': thumbnail}
+
+
+def image_type(image):
+    """
+    :return (str, str): Extension and content type of encoded image bytes, JPEG or PNG.
+    """
+    if image[:2] == b'\xff\xd8':
+        return 'jpg', 'image/jpeg'
+    return 'png', 'image/png'
+
+
+class EventUploader:
+    """
+    Posts detection events to the event server from the aiohttp event loop.
+
+    Events are submitted from any thread into a bounded queue, grouped in batches of up to batch_size events
+    per POST and sent over one pooled ClientSession, retrying with exponential backoff.
+
+    With a spool, submitted events are appended to it instead and only acknowledged once the event server
+    accepted them, so nothing is lost or held in memory while the uplink is down.
+
+    A batch the event server rejects with a client error, e.g. 400, 413 or 422, would be rejected again: it isn't
+    retried, it is counted in rejected, and acknowledged in the spool so it doesn't hold back the next events.
+
+    In 'base64' mode a batch is a JSON body {"droneId": ..., "events": [{"objects": [...], "image": "<base64>"}]},
+    events with a thumbnail have a "thumbnail" too. In 'multipart' mode it is a multipart form with droneId, the
+    events' objects as JSON and one binary image part per event, in the same order, the thumbnail parts are
+    named after the index of their event.
+    """
+
+    MODES = ('base64', 'multipart')
+
+    def __init__(self, url, drone_id, batch_size=8, batch_wait=1.0, queue_size=256, mode='base64',
+                 max_retries=5, retry_backoff=0.5, connection_limit=4, spool=None):
+        if mode not in self.MODES:
+            raise ValueError(f'Unknown upload mode {mode}, expected one of {self.MODES}')
+
+        self.url = url
+        self.drone_id = drone_id
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue_size = queue_size
+        self.mode = mode
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.connection_limit = connection_limit
+        self.spool = spool
+
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0
+        self.dropped = 0
+
+        self._loop = None
+        self._queue = None
+        self._session = None
+        self._wakeup = None
+        self._task = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.queue_size)
+        self._wakeup = asyncio.Event()
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.connection_limit))
+        self._task = asyncio.ensure_future(self._run_spooled() if self.spool is not None else self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+        if self.spool is not None:
+            self.spool.close()
+
+    def submit(self, objects, image, thumbnail=None):
+        """
+        Queues an event, can be called from any thread.
+
+        :param objects: Detections of the image.
+        :param image: Encoded image bytes.
+        :param thumbnail: Encoded thumbnail bytes of the whole frame, if any.
+        """
+        event = {'objects': objects, 'image': image, 'thumbnail': thumbnail}
+
+        if self.spool is not None:
+            self.spool.append(encode_event(event))
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            return
+
+        if self._loop is None:
+            logger.info('Event uploader is not started, dropping event')
+            self.dropped += 1
+            return
+
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'spooled': self.spool is not None and not self.spool.is_empty(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'dropped': self.dropped,
+        }
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.info('Event queue is full, dropping event')
+            self.dropped += 1
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.batch_wait
+
+        while len(batch) < self.batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                if await self.send(batch):
+                    self.sent += len(batch)
+                else:
+                    self.failed += len(batch)
+            except EventsRejected as e:
+                logger.error(e)
+                self.rejected += len(batch)
+
+    async def _run_spooled(self):
+        while True:
+            self._wakeup.clear()
+            records, position = await self._loop.run_in_executor(None, self.spool.peek, self.batch_size)
+
+            if not records:
+                await self._wakeup.wait()
+                # Give a burst the time to fill a batch.
+                await asyncio.sleep(self.batch_wait)
+                continue
+
+            batch = [decode_event(record) for record in records]
+            try:
+                if not await self.send(batch):
+                    # The events stay in the spool, keep trying until the event server is back.
+                    self.failed += len(batch)
+                    continue
+                self.sent += len(batch)
+            except EventsRejected as e:
+                # Sending it again would get the same answer.
+                logger.error(e)
+                self.rejected += len(batch)
+
+            await self._loop.run_in_executor(None, self.spool.ack, position)
+
+    async def send(self, batch):
+        """
+        :param batch: List of events.
+        :return (bool): True if the event server accepted the batch, False if it couldn't be reached.
+        :raise EventsRejected: If the event server rejected the batch for good.
+        """
+        for attempt in range(self.max_retries):
+            try:
+                async with self._session.post(self.url, **self._request_kwargs(batch)) as response:
+                    if 400 <= response.status < 500 and response.status not in RETRIED_STATUSES:
+                        raise EventsRejected(f'Event server rejected {len(batch)} events: {response.status} '
+                                             f'{await response.text()}')
+                    response.raise_for_status()
+                    logger.info(f'Events response: {response.status}')
+                    return True
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                delay = self.retry_backoff * 2 ** attempt
+                logger.info(f'Could not send {len(batch)} events, retrying in {delay}s : {e}')
+                await asyncio.sleep(delay)
+
+        return False
+
+    def _request_kwargs(self, batch):
+        if self.mode == 'multipart':
+            data = aiohttp.FormData()
+            data.add_field('droneId', self.drone_id)
+            data.add_field('events', dumps([event['objects'] for event in batch]), content_type='application/json')
+            for index, event in enumerate(batch):
+                extension, content_type = image_type(event['image'])
+                data.add_field('image', event['image'], filename=f'{index}.{extension}', content_type=content_type)
+                if event['thumbnail'] is not None:
+                    extension, content_type = image_type(event['thumbnail'])
+                    data.add_field('thumbnail', event['thumbnail'], filename=f'{index}.{extension}',
+                                   content_type=content_type)
+            return {'data': data}
+
+        body = {
+            'droneId': self.drone_id,
+            'events': [self._base64_event(event) for event in batch]
+        }
+        return {'data': dumps(body), 'headers': {'Content-Type': 'application/json'}}
+
+    @staticmethod
+    def _base64_event(event):
+        encoded = {'objects': event['objects'], 'image': base64.b64encode(event['image']).decode('ascii')}
+        if event['thumbnail'] is not None:
+            encoded['thumbnail'] = base64.b64encode(event['thumbnail']).decode('ascii')
+        return encoded
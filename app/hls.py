@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+MEDIA_SEQUENCE_RE = re.compile(r'^#EXT-X-MEDIA-SEQUENCE:(\d+)', re.MULTILINE)
+SERVER_CONTROL = '#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES'
+
+
+class PlaylistCache:
+    """
+    In-memory copy of the HLS playlist written by ffmpeg.
+
+    ffmpeg rewrites the playlist every time it finishes a segment, so the file is stat'ed every poll_interval
+    and reloaded only when it changed. Waiters of a media sequence number are woken up on reload, which gives
+    LL-HLS style blocking playlist reloads.
+    """
+
+    def __init__(self, path, poll_interval=0.1):
+        self.path = path
+        self.poll_interval = poll_interval
+
+        self.body = None
+        self.etag = None
+        self.media_sequence = 0
+        self.segment_count = 0
+
+        self._stat = None
+        self._changed = None
+        self._task = None
+
+    @property
+    def last_media_sequence(self):
+        return self.media_sequence + self.segment_count - 1
+
+    def start(self):
+        self._changed = asyncio.Condition()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def wait_for(self, media_sequence, timeout):
+        """
+        Waits until the playlist holds the segment media_sequence.
+
+        :return (bool): False if it didn't show up in time.
+        """
+        try:
+            async with self._changed:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self.last_media_sequence >= media_sequence), timeout
+                )
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _run(self):
+        while True:
+            try:
+                if self._reload():
+                    async with self._changed:
+                        self._changed.notify_all()
+            except OSError as e:
+                logger.error(e)
+
+            await asyncio.sleep(self.poll_interval)
+
+    def _reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key == self._stat:
+            return False
+        self._stat = key
+
+        with open(self.path) as f:
+            text = f.read()
+
+        match = MEDIA_SEQUENCE_RE.search(text)
+        self.media_sequence = int(match.group(1)) if match else 0
+        self.segment_count = sum(1 for line in text.splitlines() if line and not line.startswith('#'))
+
+        if SERVER_CONTROL not in text:
+            text = text.replace('#EXTM3U', f'#EXTM3U\n{SERVER_CONTROL}', 1)
+
+        self.body = text.encode('utf-8')
+        self.etag = hashlib.md5(self.body).hexdigest()
+
+        return True
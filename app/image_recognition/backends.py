@@ -0,0 +1,270 @@
+import logging
+import os
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+resnet_50_layer_model = 'resnet50_coco_best_v2.0.1.h5'
+execution_path = f'{os.getcwd()}/app/image_recognition'
+
+CAFFE_BGR_MEAN = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+# Class names of the COCO RetinaNet model by class number, as ImageAI names them.
+COCO_NAMES = (
+    'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat', 'traffic light',
+    'fire hydrant', 'stop_sign', 'parking meter', 'bench', 'bird', 'cat', 'dog', 'horse', 'sheep', 'cow',
+    'elephant', 'bear', 'zebra', 'giraffe', 'backpack', 'umbrella', 'handbag', 'tie', 'suitcase', 'frisbee', 'skis',
+    'snowboard', 'sports ball', 'kite', 'baseball bat', 'baseball glove', 'skateboard', 'surfboard',
+    'tennis racket', 'bottle', 'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple', 'sandwich',
+    'orange', 'broccoli', 'carrot', 'hot dog', 'pizza', 'donot', 'cake', 'chair', 'couch', 'potted plant', 'bed',
+    'dining table', 'toilet', 'tv', 'laptop', 'mouse', 'remote', 'keyboard', 'cell phone', 'microwave', 'oven',
+    'toaster', 'sink', 'refrigerator', 'book', 'clock', 'vase', 'scissors', 'teddy bear', 'hair dryer', 'toothbrush',
+)
+
+# The garbage the drone looks for, the other classes are discarded.
+DETECTED_OBJECTS = frozenset(('cup', 'wine glass', 'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple', 'sandwich',
+                              'person', 'orange', 'bottle'))
+
+
+class DetectorBackend:
+    """
+    Runs an object detection model on batches of frames.
+
+    load() loads the model, detect_batch() returns for every frame its detections in the format of ImageAI's
+    detectCustomObjectsFromImage: {'name', 'percentage_probability', 'box_points'}.
+    """
+
+    def load(self):
+        raise NotImplementedError
+
+    def detect_batch(self, frames, minimum_percentage_probability=50):
+        """
+        :param frames: List of (height, width, 3) uint8 RGB arrays, all of the same size.
+        :param minimum_percentage_probability: Detections below it are discarded.
+        :return: One list of detections per frame.
+        """
+        raise NotImplementedError
+
+    def warmup(self, frame_size=(960, 720), batch_size=1):
+        """
+        Runs the model on blank frames, runtimes build or tune their graph for an input shape on its first call
+        and the first real frames would pay for it.
+
+        :param frame_size: (width, height) of the frames.
+        :param batch_size: Largest batch the model will get.
+        """
+        width, height = frame_size
+        frame = np.zeros((height, width, 3), np.uint8)
+
+        start = time.time()
+        for size in sorted({1, batch_size}):
+            self.detect_batch([frame] * size)
+        logger.info(f'{type(self).__name__} warmed up in {time.time() - start:.2f}s')
+
+
+class RetinaNetBackend(DetectorBackend):
+    """
+    Pre and post processing of the COCO RetinaNet model, the subclasses run it on the batch with predict().
+    """
+
+    # Input side limits of the detection_speed settings of ImageAI, smaller inputs trade accuracy for frames/s.
+    PROFILES = {
+        'normal': (800, 1333),
+        'fast': (400, 700),
+        'faster': (300, 500),
+        'fastest': (200, 350),
+        'flash': (100, 250),
+    }
+
+    def __init__(self, model_path, profile='normal'):
+        """
+        :param profile: One of PROFILES.
+        """
+        self.model_path = model_path
+        self.names = COCO_NAMES
+        self.set_profile(profile)
+
+    def set_profile(self, profile):
+        if profile not in self.PROFILES:
+            raise ValueError(f'Unknown inference profile {profile}, expected one of {tuple(self.PROFILES)}')
+
+        self.profile = profile
+        self.input_min_side, self.input_max_side = self.PROFILES[profile]
+
+    def predict(self, images):
+        """
+        :param images: (batch, height, width, 3) float32 preprocessed images.
+        :return: (batch, detections, 4 + classes) array, the boxes followed by the class scores.
+        """
+        raise NotImplementedError
+
+    def detect_batch(self, frames, minimum_percentage_probability=50):
+        images, scales = zip(*(self._prepare_frame(frame) for frame in frames))
+        detections = self.predict(np.stack(images))
+
+        return [
+            self._decode_detections(frame_detections, scale, minimum_percentage_probability)
+            for frame_detections, scale in zip(detections, scales)
+        ]
+
+    def _prepare_frame(self, frame):
+        # Same preprocessing as ImageAI: BGR, caffe mean subtraction, scaled to the input side limits.
+        image = frame[:, :, ::-1].astype(np.float32)
+        image -= CAFFE_BGR_MEAN
+
+        height, width = frame.shape[:2]
+        scale = min(self.input_min_side / min(height, width), self.input_max_side / max(height, width))
+        image = cv2.resize(image, None, fx=scale, fy=scale)
+
+        return image, scale
+
+    def _decode_detections(self, detections, scale, minimum_percentage_probability):
+        labels = np.argmax(detections[:, 4:], axis=1)
+        scores = detections[np.arange(len(detections)), 4 + labels] * 100
+        keep = scores >= minimum_percentage_probability
+
+        objects = []
+        for box, label, score in zip(detections[keep, :4] / scale, labels[keep], scores[keep]):
+            name = self.names[int(label)]
+            if name not in DETECTED_OBJECTS:
+                continue
+
+            objects.append({
+                'name': name,
+                'percentage_probability': float(score),
+                'box_points': box.astype(int).tolist()
+            })
+
+        return objects
+
+
+class ImageAIBackend(RetinaNetBackend):
+    """
+    The RetinaNet .h5 model loaded by ImageAI, run on Keras.
+    """
+
+    def __init__(self, model_path=None, profile='normal'):
+        super().__init__(os.path.join(execution_path, resnet_50_layer_model) if model_path is None else model_path,
+                         profile)
+        self.model = None
+
+    def load(self):
+        from imageai.Detection import ObjectDetection
+
+        detector = ObjectDetection()
+        detector.setModelTypeAsRetinaNet()
+        detector.setModelPath(self.model_path)
+        detector.loadModel()
+
+        self.names = detector.numbers_to_names
+        # ImageAI doesn't expose the Keras model, its detect methods only take one image at a time.
+        self.model = detector._ObjectDetection__model_collection[0]
+
+    def predict(self, images):
+        _, _, detections = self.model.predict_on_batch(images)
+        return detections
+
+
+class TfliteBackend(RetinaNetBackend):
+    """
+    A TensorFlow Lite conversion of the RetinaNet model, e.g. an int8 or float16 one.
+    """
+
+    def __init__(self, model_path, profile='normal', num_threads=None):
+        super().__init__(model_path, profile)
+        self.num_threads = num_threads
+
+        self.interpreter = None
+        self._input = None
+        self._shape = None
+
+    def load(self):
+        import tensorflow as tf
+
+        self.interpreter = tf.lite.Interpreter(model_path=self.model_path,
+                                               num_threads=self.num_threads or os.cpu_count())
+        self._input = self.interpreter.get_input_details()[0]
+
+    def predict(self, images):
+        if self._shape != images.shape:
+            self.interpreter.resize_tensor_input(self._input['index'], images.shape)
+            self.interpreter.allocate_tensors()
+            self._shape = images.shape
+
+        scale, zero_point = self._input['quantization']
+        if scale:
+            images = np.round(images / scale + zero_point)
+        self.interpreter.set_tensor(self._input['index'], images.astype(self._input['dtype']))
+        self.interpreter.invoke()
+
+        outputs = []
+        for detail in self.interpreter.get_output_details():
+            output = self.interpreter.get_tensor(detail['index'])
+            scale, zero_point = detail['quantization']
+            if scale:
+                output = (output.astype(np.float32) - zero_point) * scale
+            outputs.append(output)
+
+        # The converter doesn't keep the output order, the detections are the boxes followed by the class scores.
+        return max(outputs, key=lambda output: output.shape[-1])
+
+
+class OnnxRuntimeBackend(RetinaNetBackend):
+    """
+    An ONNX export of the RetinaNet model, e.g. by tf2onnx, run by ONNX Runtime on the CPU. Doesn't need
+    TensorFlow.
+    """
+
+    def __init__(self, model_path, profile='normal', intra_op_threads=0, inter_op_threads=0, session_options=None):
+        """
+        :param intra_op_threads: Threads running an operator, 0 lets ONNX Runtime pick.
+        :param inter_op_threads: Threads running independent operators, 0 lets ONNX Runtime pick.
+        :param session_options: Other onnxruntime.SessionOptions attributes, e.g. {'enable_mem_pattern': False}.
+        """
+        super().__init__(model_path, profile)
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.session_options = session_options or {}
+
+        self.session = None
+        self._input = None
+
+    def load(self):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        for name, value in self.session_options.items():
+            setattr(options, name, value)
+
+        self.session = onnxruntime.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+        self._input = self.session.get_inputs()[0].name
+
+    def predict(self, images):
+        outputs = self.session.run(None, {self._input: images})
+        # Same outputs as the Keras model, the detections are the boxes followed by the class scores.
+        return max(outputs, key=lambda output: output.shape[-1])
+
+
+BACKENDS = {
+    'imageai': ImageAIBackend,
+    'tflite': TfliteBackend,
+    'onnxruntime': OnnxRuntimeBackend,
+}
+
+
+def create_backend(name, **options):
+    """
+    :param name: One of BACKENDS.
+    :param options: Keyword arguments of the backend.
+    :return (DetectorBackend): The backend, not loaded.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown detector backend {name}, expected one of {tuple(BACKENDS)}')
+
+    return BACKENDS[name](**options)
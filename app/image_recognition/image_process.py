@@ -1,88 +1,270 @@
-import asyncio
+import glob
 import logging
 import os
+import queue
 import subprocess as sp
 import time
-from threading import Thread
-from aiohttp_requests import requests
-import app.image_recognition.recognition as recognition
+from threading import Event, Lock, Thread
+from app.image_recognition.payload import PayloadEncoder
+from app.image_recognition.workers import DetectionPool, get_results_from_pool
 
 logger = logging.getLogger(__name__)
 
 
 class StreamToImagesThread(Thread):
-    INDIR = f'{os.getcwd()}/app/stream'
-    INFILE = f'{INDIR}/data' #stream.m3u8'
+    """
+    Extracts images from the HLS segments written by the VideoReceiver.
+
+    The playlist is used as the index of finished segments: it is re-read only when it changes and
+    every segment is decoded once, by an ffmpeg that is waited for. The paths of the extracted images are
+    handed to on_photo with the time they were captured at: ffmpeg finishes a segment, and so sets its mtime,
+    when the stream goes past its end.
+    """
+
     OUTFILE = "app/photos/"
+    POLL_INTERVAL = 0.5
 
-    def __init__(self):
+    def __init__(self, playlist, on_photo, fps=1):
+        """
+        :param playlist: Path of the HLS playlist written by the VideoReceiver.
+        :param on_photo: Called with the path of every extracted image and its time.time() of capture.
+        """
         super().__init__()
+        self.playlist = playlist
+        self.indir = os.path.dirname(playlist)
+        self.on_photo = on_photo
+        self.fps = fps
         self.stopped = False
 
+        # (mtime, size) of the processed segments by name, a name ffmpeg reuses after a restart is a new segment.
+        self.processed_segments = {}
+        self._playlist_mtime = None
+
+        os.makedirs(self.OUTFILE, exist_ok=True)
+
     def run(self):
         self.stopped = False
-        # ffmpeg -i filename.m3u8  -f image2 -vf fps=fps=1 img%03d.jpg
-
-        # stream = (
-        #             ffmpeg
-        #                 .input(self.INFILE)
-        #                 .filter('fps', fps=25, round='up')
-        #                 .output(self.OUTFILE, format='image2')
-        #                 .compile()
-        #             )
-
-
-        # command = ['ffmpeg',
-        #            '-y',  # (optional) overwrite output file if it exists
-        #            '-f', 'rawvideo',
-        #            '-vcodec', 'rawvideo',
-        #            '-s', '420x360',  # size of one frame
-        #            '-pix_fmt', 'rgb24',
-        #            '-r', '24',  # frames per second
-        #            '-i', f'{os.getcwd()}/{self.INFILE}',  # The imput comes from a pipe
-        #            '-an',  # Tells FFMPEG not to expect any audio
-        #            '-vcodec', f'{os.getcwd()}/my_output_videofile.mp4']
-
-        command = ['ffmpeg',
-                   '-i',  f'{self.INFILE}',
-                   '-r', '1',
-                   f'{self.OUTFILE}/output_%03d.png']
 
         while not self.stopped:
+            for segment, key, duration in self._new_segments():
+                self._extract_images(segment, key, duration)
 
-            while len(os.listdir(f'{self.INDIR}')) == 0:
-                continue
-
-            sp.Popen(command)
-            time.sleep(30)
+            time.sleep(self.POLL_INTERVAL)
 
         self.stopped = False
 
     def stop(self):
         self.stopped = True
 
+    def _new_segments(self):
+        try:
+            mtime = os.stat(self.playlist).st_mtime_ns
+        except FileNotFoundError:
+            return []
+
+        if mtime == self._playlist_mtime:
+            return []
+        self._playlist_mtime = mtime
+
+        # Duration of every segment, from the #EXTINF tag before it.
+        segments = {}
+        duration = 0.0
+        with open(self.playlist) as playlist:
+            for line in playlist:
+                line = line.strip()
+                if line.startswith('#EXTINF:'):
+                    duration = float(line[len('#EXTINF:'):].split(',')[0])
+                elif line and not line.startswith('#'):
+                    segments[line] = duration
+
+        # Segments that left the playlist are deleted, forget them so the dict stays as small as the playlist.
+        self.processed_segments = {segment: key for segment, key in self.processed_segments.items()
+                                   if segment in segments}
+
+        new_segments = []
+        for segment, duration in segments.items():
+            try:
+                stat = os.stat(os.path.join(self.indir, segment))
+            except FileNotFoundError:
+                continue
+
+            key = (stat.st_mtime_ns, stat.st_size)
+            if self.processed_segments.get(segment) != key:
+                new_segments.append((segment, key, duration))
+
+        return new_segments
+
+    def _extract_images(self, segment, key, duration):
+        name, _ = os.path.splitext(segment)
+        pattern = os.path.join(self.OUTFILE, f'{name}_%03d.png')
+        command = ['ffmpeg',
+                   '-loglevel', 'error',
+                   '-y',
+                   '-i', os.path.join(self.indir, segment),
+                   '-r', f'{self.fps}',
+                   pattern]
+
+        result = sp.run(command, stdin=sp.DEVNULL)
+        self.processed_segments[segment] = key
+        if result.returncode != 0:
+            logger.error(f'Could not extract images from {segment}')
+            return
+
+        started_at = key[0] / 1e9 - duration
+        paths = sorted(glob.glob(os.path.join(self.OUTFILE, f'{glob.escape(name)}_[0-9][0-9][0-9].png')))
+        for index, path in enumerate(paths):
+            self.on_photo(os.path.abspath(path), started_at + index / self.fps)
+
 
 class ImageProcessingThread(Thread):
-    INDIR = f'{os.getcwd()}/app/photos'
+    # Seconds between two checks for the finished batches of the pool while no frame arrives.
+    RESULT_POLL = 0.1
 
-    def __init__(self):
-        super().__init__()
-        self.manager = recognition.AIManager()
+    def __init__(self, source='files', batch_size=1, batch_wait=0, workers=0, gate=None, uploader=None, tracker=None,
+                 geotagger=None, payload=None, debug=False, manager_options=None):
+        """
+        :param manager_options: Keyword arguments of the AIManager, e.g. its inference profile.
+        :param payload: PayloadEncoder of the event images, crops by default.
+        :param debug: Writes the frames with detections, boxes drawn, to recognition.output_path.
+        """
+        super().__init__(daemon=True)
+        self.source = source
+        self.uploader = uploader
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.workers = workers if source == 'pipe' else 0
+        self.gate = gate
+        self.tracker = tracker
+        self.geotagger = geotagger
+        self.payload = PayloadEncoder() if payload is None else payload
+        self.debug = debug
+        self.manager_options = manager_options or {}
+
+        self.manager = None
+        self.pool = None
+        self.ready = Event()
+        self.stopped = False
+        self._put_lock = Lock()
+
+        self.frames = queue.Queue(maxsize=batch_size * max(self.workers, 1))
+        self.photos = queue.Queue()
+
+    def put_photo(self, path, captured_at=None):
+        """
+        Called by the StreamToImagesThread with every image extracted from the video.
+
+        :param captured_at: time.time() the image was captured at, now if None.
+        """
+        self.photos.put((path, time.time() if captured_at is None else captured_at))
+
+    def put_frame(self, frame, captured_at=None):
+        """
+        Called by the video decoder. Only the latest batch of frames is kept, so detection doesn't fall behind.
+        Frames the motion gate skips give no result, tracks only age on detected frames so they span them.
+
+        :param captured_at: time.time() the frame was decoded at, now if None. Detections are geotagged with the
+            pose of the drone at that time.
+        """
+        if self.gate is not None and not self.gate.needs_detection(frame):
+            return
+
+        # Under the lock a frame can't push the None of stop() out of the queue.
+        with self._put_lock:
+            if not self.stopped:
+                self._put_latest((frame, time.time() if captured_at is None else captured_at))
+
+    def stop(self):
+        """
+        Ends the thread once the frames being detected are done, reports the live tracks and closes the worker
+        pool.
+        """
+        with self._put_lock:
+            self.stopped = True
+            self._put_latest(None)
+        self.photos.put(None)
+
+    def _put_latest(self, frame):
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                pass
+            self.frames.put_nowait(frame)
 
     def run(self):
-        # loop = asyncio.get_event_loop()
-
-        for objects, base64obj in recognition.get_results_from_photos(self.INDIR, self.manager):
-            print(objects)
-            # if objects:
-                # loop.run_until_complete(self._make_request(base64obj))
-
-    async def _make_request(self, base64obj):
-        payload = {
-            "droneId": "Keren-001",
-            "image": base64obj
-        }
-        response = await requests.post('http://192.168.6.100:8080/event', data=payload)
-        response_json = await response.json()
-
-        logger.info(f'Photo response: {response_json}')
+        # Importing ImageAI pulls TensorFlow in and loading the model takes seconds, both are done here so they
+        # don't hold the startup of the web server.
+        import app.image_recognition.recognition as recognition
+
+        if self.workers:
+            self.pool = DetectionPool(self.workers, self.manager_options)
+            self.pool.wait_ready()
+        else:
+            self.manager = recognition.AIManager(**self.manager_options)
+        self.ready.set()
+        logger.info('Detector ready')
+
+        try:
+            self._process(recognition)
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+
+    def _process(self, recognition):
+        if self.pool is not None:
+            batches = recognition.get_batches(self.frames, self.batch_size, self.batch_wait, idle=self.RESULT_POLL)
+            results = get_results_from_pool(batches, self.pool)
+        elif self.source == 'pipe':
+            results = recognition.get_results_from_frames(self.frames, self.manager,
+                                                          self.batch_size, self.batch_wait)
+        else:
+            results = recognition.get_results_from_photos(self.photos, self.manager)
+
+        for objects, frame, captured_at in results:
+            try:
+                self._handle(recognition, objects, frame, captured_at)
+            except Exception:
+                # A result that can't be handled is lost, not the detection thread.
+                logger.exception(f'Could not handle the detections {objects}')
+
+        # The objects still in view when the thread stops.
+        if self.tracker is not None and self.uploader is not None:
+            self._submit_tracks(self.tracker.flush())
+
+    def _handle(self, recognition, objects, frame, captured_at):
+        logger.debug(f'Detections at {captured_at}: {objects}')
+
+        if objects and self.debug:
+            recognition.write_annotated(f'{captured_at:.3f}.jpg', frame, objects)
+
+        if self.uploader is None:
+            return
+
+        if self.tracker is None:
+            if objects:
+                for detection in objects:
+                    self._geotag(detection, captured_at)
+                self._submit(objects, frame)
+            return
+
+        # One event per tracked object once it is gone, with its best detection.
+        self._submit_tracks(self.tracker.update(objects, frame, captured_at))
+
+    def _submit_tracks(self, tracks):
+        for track in tracks:
+            detection = track.as_object()
+            try:
+                self._geotag(detection, track.best_at)
+                self._submit([detection], track.image)
+            except Exception:
+                logger.exception(f'Could not submit the track {detection}')
+
+    def _submit(self, objects, frame):
+        for event_objects, image, thumbnail in self.payload.encode(objects, frame):
+            self.uploader.submit(event_objects, image, thumbnail)
+
+    def _geotag(self, detection, detected_at):
+        if self.geotagger is not None:
+            self.geotagger.tag(detection, detected_at)
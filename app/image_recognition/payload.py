@@ -0,0 +1,73 @@
+import cv2
+
+
+class PayloadEncoder:
+    """
+    Encodes the images of the detection events in memory, as JPEG, from the decoded RGB frame.
+
+    In 'crops' mode an event is sent per detection with the crop of its box, in 'frame' mode an event per frame
+    with the whole frame. Both can come with a low resolution thumbnail of the frame, for context.
+    """
+
+    MODES = ('crops', 'frame')
+
+    def __init__(self, mode='crops', quality=85, thumbnail_size=None, crop_margin=0.1):
+        """
+        :param quality: JPEG quality, 0 to 100.
+        :param thumbnail_size: Longest side of the thumbnail in pixels, no thumbnail if None.
+        :param crop_margin: Fraction of the box size added around a crop.
+        """
+        if mode not in self.MODES:
+            raise ValueError(f'Unknown payload mode {mode}, expected one of {self.MODES}')
+
+        self.mode = mode
+        self.quality = quality
+        self.thumbnail_size = thumbnail_size
+        self.crop_margin = crop_margin
+
+    def encode(self, objects, frame):
+        """
+        :param objects: Detections of the frame.
+        :param frame: (height, width, 3) uint8 RGB array.
+        :return (list): (objects, image, thumbnail) of every event, thumbnail is None without thumbnail_size. A
+            detection with an empty crop, a box without area or outside the frame, has no event.
+        """
+        thumbnail = self.encode_thumbnail(frame) if self.thumbnail_size else None
+
+        if self.mode == 'frame':
+            return [(objects, self.encode_jpeg(frame), thumbnail)]
+
+        events = []
+        for detection in objects:
+            crop = self.encode_crop(frame, detection['box_points'])
+            if crop is not None:
+                events.append(([detection], crop, thumbnail))
+        return events
+
+    def encode_crop(self, frame, box):
+        """
+        :return (bytes): The JPEG of the crop, None if it is empty.
+        """
+        height, width = frame.shape[:2]
+        x1, y1, x2, y2 = box
+        margin_x = int((x2 - x1) * self.crop_margin)
+        margin_y = int((y2 - y1) * self.crop_margin)
+
+        crop = frame[max(0, int(y1) - margin_y):min(height, int(y2) + margin_y),
+                     max(0, int(x1) - margin_x):min(width, int(x2) + margin_x)]
+        if crop.size == 0:
+            return None
+
+        return self.encode_jpeg(crop)
+
+    def encode_thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.thumbnail_size / max(height, width)
+        if scale < 1:
+            frame = cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+        return self.encode_jpeg(frame)
+
+    def encode_jpeg(self, image):
+        _, jpeg = cv2.imencode('.jpg', cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return jpeg.tobytes()
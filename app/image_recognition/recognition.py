@@ -1,13 +1,15 @@
-from imageai.Detection import ObjectDetection
+import logging
 import os
-import base64
 import time
+import queue
+import cv2
+from app.image_recognition.backends import create_backend
 # import aimanager
 
+logger = logging.getLogger(__name__)
+
 # Constants
 dataset_string = 'dataset'
-resnet_50_layer_model = 'resnet50_coco_best_v2.0.1.h5'
-execution_path = f'{os.getcwd()}/app/image_recognition'
 photos_path = f'{os.getcwd()}/app/photos'
 
 output_path = f'{os.getcwd()}/app/output_photos'
@@ -15,70 +17,181 @@ output_path = f'{os.getcwd()}/app/output_photos'
 
 class AIManager:
 
-    def __init__(self):
-        self.detector = ObjectDetection()
-        self._init_detector_()
-        self.custom_objects = self._init_custom_objects_()
-
-    def _init_detector_(self):
-        self.detector.setModelTypeAsRetinaNet()
-        self.detector.setModelPath(os.path.join(execution_path, resnet_50_layer_model))
-        self.detector.loadModel()
-
-    def _init_custom_objects_(self):
-        return self.detector.CustomObjects(cup=True, wine_glass=True, fork=True,
-                                           knife=True, spoon=True, bowl=True,
-                                           banana=True, apple=True, sandwich=True,
-                                           person=True, orange=True, bottle=True)
+    def __init__(self, backend='imageai', profile='normal', model_path=None, warmup_frame_size=None,
+                 warmup_batch_size=1, backend_options=None):
+        """
+        :param backend: Name of the detector backend, one of backends.BACKENDS.
+        :param profile: Inference profile of the backend, one of RetinaNetBackend.PROFILES.
+        :param model_path: Model file of the backend, the RetinaNet .h5 of ImageAI by default.
+        :param warmup_frame_size: (width, height) of the frames to warm the model up with, none if None.
+        :param warmup_batch_size: Largest batch the model will get.
+        :param backend_options: Other keyword arguments of the backend, e.g. its threads.
+        """
+        options = dict(backend_options or {}, profile=profile)
+        if model_path is not None:
+            options['model_path'] = model_path
+
+        self.backend = create_backend(backend, **options)
+        self.backend.load()
+
+        if warmup_frame_size is not None:
+            self.backend.warmup(warmup_frame_size, warmup_batch_size)
+
+    def set_profile(self, profile):
+        self.backend.set_profile(profile)
 
     def process_image(self, input_image_folder):
+        """
+        Runs the detector on a photo, given by its path or its name in photos_path. Photos without objects are
+        deleted.
+
+        :return: The found objects and the photo as an RGB array, or (None, None) if nothing was found.
+        """
         start = time.time()
-        image = input_image_folder.split('/')[-1]
-        # rest_path = input_image_folder.split('/')[:-1]
-
-        inp_image_folder = os.path.join(photos_path, input_image_folder)
-        detections = self.detector.detectCustomObjectsFromImage(
-            custom_objects=self.custom_objects,
-            input_image=inp_image_folder,
-            output_image_path=f'{output_path}/{image}',
-            input_type='file',
-            output_type='file',
-            minimum_percentage_probability=50
-        )
-        objects = []
-        # Append the found objects
-        for eachObject in detections:
-            objects.append(eachObject)
-
-        # If there are no objects found , delete the result photos
-        if not objects:
-            # os.remove(output_image_folder)
-            os.remove(input_image_folder)
-            end = time.time()
-            print(end - start)
+        path = os.path.join(photos_path, input_image_folder)
+
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
             return None, None
+        frame = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-        # Convert image into base64
-        with open(input_image_folder, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read())
+        objects = self.detect_batch([frame])[0]
         end = time.time()
-        print(end - start)
+        logger.debug(f'Detected {input_image_folder} in {end - start:.3f} s')
 
-        return objects, encoded_string
+        # If there are no objects found , delete the photo
+        if not objects:
+            os.remove(path)
+            return None, None
+
+        return objects, frame
 
+    def detect_batch(self, frames, minimum_percentage_probability=50):
+        """
+        Runs the detector once on a whole batch of frames.
 
+        :param frames: List of (height, width, 3) uint8 RGB arrays, all of the same size.
+        :param minimum_percentage_probability: Detections below it are discarded.
+        :return: One list of detections per frame, in the same format as detectCustomObjectsFromImage.
+        """
+        return self.backend.detect_batch(frames, minimum_percentage_probability)
 
+    def process_batch(self, frames):
+        """
+        Runs the detector on decoded frames, without touching the disk.
 
-# This method returns null if there is no results from a photo
-def get_results_from_photos(dir, manager):
-    names = os.listdir(dir)
-    print(dir)
-    for name in names:
-        # photo_pull_full_path = os.path.join(dir, name)
-        objects, base64obj = manager.process_image(name)
-        yield objects, base64obj
+        :param frames: List of (height, width, 3) uint8 RGB arrays, all of the same size.
+        :return: For every frame the found objects and the frame, or (None, None) if nothing was found.
+        """
+        start = time.time()
+        batch_detections = self.detect_batch(frames)
+        end = time.time()
+        logger.debug(f'Detected a batch of {len(frames)} frames in {end - start:.3f} s')
+
+        results = []
+        for frame, objects in zip(frames, batch_detections):
+            if not objects:
+                results.append((None, None))
+                continue
+
+            results.append((objects, frame))
+
+        return results
+
+    def process_array(self, frame):
+        return self.process_batch([frame])[0]
+
+def write_annotated(name, frame, objects):
+    """
+    Writes a frame with the boxes of its detections drawn to output_path, for debugging.
+
+    :param frame: (height, width, 3) uint8 RGB array.
+    """
+    image = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    for detection in objects:
+        x1, y1, x2, y2 = detection['box_points']
+        cv2.rectangle(image, (x1, y1), (x2, y2), (0, 0, 255), 2)
+        cv2.putText(image, f"{detection['name']} {detection['percentage_probability']:.0f}", (x1, max(0, y1 - 5)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+
+    os.makedirs(output_path, exist_ok=True)
+    cv2.imwrite(os.path.join(output_path, name), image)
+
+
+def get_batches(frames, batch_size, max_wait, idle=None):
+    """
+    Groups the frames of a queue in batches.
+
+    :param frames: queue.Queue of frames, or (frame, captured_at), a None ends the batches.
+    :param batch_size: Maximum number of frames of a batch.
+    :param max_wait: Seconds to wait for a full batch after its first frame arrived.
+    :param idle: Seconds without frames after which an empty batch is yielded, so the consumer gets control back.
+        None waits for the next frame.
+    :return (generator): Lists of 1 to batch_size frames, as queued, or empty ones every idle seconds.
+    """
+    while True:
+        try:
+            frame = frames.get(timeout=idle)
+        except queue.Empty:
+            yield []
+            continue
+        if frame is None:
+            return
+
+        batch = [frame]
+        deadline = time.monotonic() + max_wait
+
+        while len(batch) < batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                frame = frames.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            if frame is None:
+                yield batch
+                return
+            batch.append(frame)
+
+        yield batch
+
+
+def get_results_from_photos(photos, manager):
+    """
+    :param photos: queue.Queue of the (path, captured_at) of the photos, in the order they were taken, a None ends
+        the results.
+    :return (generator): (objects, frame, captured_at) for every photo, objects and frame are None if nothing was
+        found.
+    """
+    for path, captured_at in iter(photos.get, None):
+        try:
+            objects, frame = manager.process_image(path)
+        except Exception:
+            logger.exception(f'Could not detect {path}')
+            continue
+
+        yield objects, frame, captured_at
+
+
+def get_results_from_frames(frames, manager, batch_size=1, max_wait=0):
+    """
+    :param frames: queue.Queue of (frame, captured_at), a None ends the results.
+    :return (generator): (objects, frame, captured_at) for every frame, objects and frame are None if nothing was
+        found.
+    """
+    for batch in get_batches(frames, batch_size, max_wait):
+        try:
+            results = manager.process_batch([frame for frame, _ in batch])
+        except Exception:
+            logger.exception(f'Could not detect a batch of {len(batch)} frames')
+            continue
+
+        for (objects, frame), (_, captured_at) in zip(results, batch):
+            yield objects, frame, captured_at
 
 
 def get_result_from_photo(photo, manager):
-    objects, base64obj = manager.process_image(photo)
-    return objects, base64obj
\ No newline at end of file
+    objects, frame = manager.process_image(photo)
+    return objects, frame
\ No newline at end of file
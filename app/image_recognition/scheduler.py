@@ -0,0 +1,41 @@
+import numpy as np
+
+
+class MotionGate:
+    """
+    Decides which frames are worth running the detector on.
+
+    Frames are compared, downscaled to grayscale, with the last frame that went through the detector. A frame
+    is detected when the mean absolute difference passes threshold (0-255 scale) or after max_interval skipped
+    frames. Skipped frames give no detections, they show the scene of the last detected frame.
+    """
+
+    def __init__(self, threshold=6.0, max_interval=10, downscale=8):
+        self.threshold = threshold
+        self.max_interval = max_interval
+        self.downscale = downscale
+
+        self.detected = 0
+        self.skipped = 0
+
+        self._reference = None
+        self._since_detection = 0
+
+    def needs_detection(self, frame):
+        """
+        :param frame: (height, width, 3) uint8 array.
+        :return (bool): True if the frame has to go through the detector.
+        """
+        small = frame[::self.downscale, ::self.downscale].mean(axis=2, dtype=np.float32)
+
+        if (self._reference is None or self._reference.shape != small.shape
+                or self._since_detection >= self.max_interval
+                or np.abs(small - self._reference).mean() > self.threshold):
+            self._reference = small
+            self._since_detection = 0
+            self.detected += 1
+            return True
+
+        self._since_detection += 1
+        self.skipped += 1
+        return False
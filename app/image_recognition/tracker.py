@@ -0,0 +1,152 @@
+import itertools
+import time
+
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    :param boxes_a: (n, 4) array of x1, y1, x2, y2 boxes.
+    :param boxes_b: (m, 4) array of x1, y1, x2, y2 boxes.
+    :return: (n, m) array of the intersection over union of every pair.
+    """
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+class Track:
+    __slots__ = ('id', 'name', 'box', 'first_seen', 'last_seen', 'hits', 'missed', 'best', 'best_at', 'image',
+                 'reported')
+
+    def __init__(self, track_id, detection, image, seen_at):
+        self.id = track_id
+        self.name = detection['name']
+        self.first_seen = seen_at
+        self.hits = 0
+        self.best = None
+        self.image = None
+        self.reported = False
+        self.update(detection, image, seen_at)
+
+    def update(self, detection, image, seen_at):
+        self.box = detection['box_points']
+        self.last_seen = seen_at
+        self.hits += 1
+        self.missed = 0
+
+        # Only a reference to the frame is kept, its images are encoded once when the track ends.
+        if self.best is None or detection['percentage_probability'] > self.best['percentage_probability']:
+            self.best = detection
+            self.best_at = seen_at
+            self.image = image
+
+    def as_object(self):
+        return dict(self.best, track_id=self.id, first_seen=self.first_seen, last_seen=self.last_seen,
+                    frames=self.hits)
+
+
+class IouTracker:
+    """
+    Follows the detections of the same object across frames, so an object seen for a while becomes one event.
+
+    Detections are associated to the live tracks of the same class by greedy best intersection over union. A
+    track ends when it wasn't matched by max_missed detected frames in a row, it then stands for all of its
+    detections with the best scoring one. A track still live max_age seconds after it started, an object that
+    stays in view, is reported then, and only then.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=3, max_age=None):
+        """
+        :param max_age: Seconds after which a live track is reported, only when it ends if None.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.max_age = max_age
+
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, objects, image, seen_at=None):
+        """
+        Must be called for every detected frame, frames without detections age the tracks.
+
+        :param objects: Detections of the frame, None or empty if there are none.
+        :param image: Frame the detections come from.
+        :param seen_at: Timestamp of the frame, now if None.
+        :return (list): Tracks to report, those that ended or reached max_age.
+        """
+        objects = objects or []
+        seen_at = time.time() if seen_at is None else seen_at
+
+        matches = self._associate(objects)
+        matched_tracks = set(matches)
+        matched_objects = set(matches.values())
+
+        for index, track in enumerate(self.tracks):
+            if index in matched_tracks:
+                track.update(objects[matches[index]], image, seen_at)
+            else:
+                track.missed += 1
+
+        ended = [track for track in self.tracks if track.missed > self.max_missed]
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for index, detection in enumerate(objects):
+            if index not in matched_objects:
+                self.tracks.append(Track(next(self._ids), detection, image, seen_at))
+
+        aged = []
+        if self.max_age is not None:
+            aged = [track for track in self.tracks if seen_at - track.first_seen >= self.max_age]
+
+        return self._report(ended + aged)
+
+    def flush(self):
+        """
+        :return (list): The live tracks to report, ended.
+        """
+        ended, self.tracks = self.tracks, []
+        return self._report(ended)
+
+    @staticmethod
+    def _report(tracks):
+        reported = [track for track in tracks if not track.reported]
+        for track in reported:
+            track.reported = True
+        return reported
+
+    def _associate(self, objects):
+        """
+        :return (dict): Index of the matched detection by index of the track.
+        """
+        if not self.tracks or not objects:
+            return {}
+
+        track_boxes = np.array([track.box for track in self.tracks], dtype=np.float32)
+        boxes = np.array([detection['box_points'] for detection in objects], dtype=np.float32)
+        iou = iou_matrix(track_boxes, boxes)
+
+        track_names = np.array([track.name for track in self.tracks])
+        names = np.array([detection['name'] for detection in objects])
+        iou[track_names[:, None] != names[None, :]] = 0
+
+        matches = {}
+        for _ in range(min(iou.shape)):
+            track, detection = np.unravel_index(np.argmax(iou), iou.shape)
+            if iou[track, detection] < self.iou_threshold:
+                break
+
+            matches[int(track)] = int(detection)
+            iou[track, :] = 0
+            iou[:, detection] = 0
+
+        return matches
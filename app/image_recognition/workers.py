@@ -0,0 +1,122 @@
+import collections
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# The AIManager of a worker process, loaded once by _init_worker.
+_manager = None
+
+
+def _init_worker(manager_options, loaded):
+    global _manager
+
+    import app.image_recognition.recognition as recognition
+    _manager = recognition.AIManager(**manager_options)
+    loaded.release()
+
+
+def _process_shared_batch(name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        frames = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        detections = _manager.detect_batch(list(frames))
+        del frames
+        return detections
+    finally:
+        shm.close()
+
+
+class DetectionPool:
+    """
+    Pool of detection processes, each one loading the model once at startup.
+
+    Batches of frames are handed to the workers through shared memory, only the name of the block travels
+    through the pool's pipes. Only the detections come back, asynchronously, the frames are still in the parent.
+    """
+
+    def __init__(self, processes, manager_options=None):
+        """
+        :param manager_options: Keyword arguments of the AIManager of every worker.
+        """
+        self.processes = processes
+        # TensorFlow doesn't survive a fork, the workers start from a fresh interpreter.
+        context = multiprocessing.get_context('spawn')
+        # Released by every worker once its model is loaded.
+        self._loaded = context.Semaphore(0)
+        self._pool = context.Pool(processes, initializer=_init_worker,
+                                  initargs=(manager_options or {}, self._loaded))
+
+    def wait_ready(self):
+        """
+        Blocks until every worker loaded its model.
+        """
+        for _ in range(self.processes):
+            self._loaded.acquire()
+
+    def submit(self, frames):
+        """
+        :param frames: List of (height, width, 3) uint8 RGB arrays, all of the same size.
+        :return (multiprocessing.pool.AsyncResult): The results of AIManager.detect_batch for the frames.
+        """
+        shape = (len(frames), ) + frames[0].shape
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * frames[0].itemsize)
+
+        batch = np.ndarray(shape, dtype=frames[0].dtype, buffer=shm.buf)
+        for index, frame in enumerate(frames):
+            batch[index] = frame
+        del batch
+
+        def release(_):
+            shm.close()
+            shm.unlink()
+
+        return self._pool.apply_async(
+            _process_shared_batch, (shm.name, shape, frames[0].dtype.str),
+            callback=release, error_callback=release
+        )
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+def get_results_from_pool(batches, pool):
+    """
+    Dispatches batches of frames to the pool, keeping every worker busy, and yields the results in order.
+
+    :param batches: Iterable of lists of (frame, captured_at), e.g. recognition.get_batches(). An empty batch only
+        yields the results that are ready, it should come regularly while no frame arrives.
+    :param pool: DetectionPool.
+    :return (generator): (objects, frame, captured_at) for every frame, objects and frame are None if nothing was
+        found.
+    """
+    pending = collections.deque()
+
+    for batch in batches:
+        if batch:
+            pending.append((pool.submit([frame for frame, _ in batch]), batch))
+
+        while pending and (len(pending) > pool.processes or pending[0][0].ready()):
+            yield from _pop_results(pending)
+
+    while pending:
+        yield from _pop_results(pending)
+
+
+def _pop_results(pending):
+    result, batch = pending.popleft()
+    try:
+        detections = result.get()
+    except Exception as e:
+        logger.error(e)
+        return
+
+    for objects, (frame, captured_at) in zip(detections, batch):
+        if objects:
+            yield objects, frame, captured_at
+        else:
+            yield None, None, captured_at
@@ -1,10 +1,23 @@
 # -*- coding: utf-8 -*-
-from .views import CommandWebSocketView, StatusWebSocketView, HlsVideoView
+from .views import CommandWebSocketView, StatusWebSocketView, HlsVideoView, HlsPlaylistView, HlsSegmentView, \
+    VideoWebSocketView, ReadyView, ClustersView
 
 ROUTERS = (
+    ('GET', '/ready', ReadyView, 'ready_view'),
     ('GET', '/command', CommandWebSocketView, 'command_view'),
     ('GET', '/status', StatusWebSocketView, 'status_view'),
     ('GET', '/video', HlsVideoView, 'video_view'),
+    ('GET', '/video/ws', VideoWebSocketView, 'video_ws_view'),
+    ('GET', '/video/stream.m3u8', HlsPlaylistView, 'video_playlist_view'),
+    ('GET', '/video/{segment}', HlsSegmentView, 'video_segment_view'),
+    ('GET', '/clusters', ClustersView, 'clusters_view'),
+    ('GET', '/drones/{drone_id}/command', CommandWebSocketView, 'drone_command_view'),
+    ('GET', '/drones/{drone_id}/status', StatusWebSocketView, 'drone_status_view'),
+    ('GET', '/drones/{drone_id}/video', HlsVideoView, 'drone_video_view'),
+    ('GET', '/drones/{drone_id}/video/ws', VideoWebSocketView, 'drone_video_ws_view'),
+    ('GET', '/drones/{drone_id}/video/stream.m3u8', HlsPlaylistView, 'drone_video_playlist_view'),
+    ('GET', '/drones/{drone_id}/video/{segment}', HlsSegmentView, 'drone_video_segment_view'),
+    ('GET', '/drones/{drone_id}/clusters', ClustersView, 'drone_clusters_view'),
 )
 
 
@@ -16,3 +16,4 @@ class Commands:
     F_B = 'F_B'
     STOP_VIDEO = 'STOP_VIDEO'
     START_VIDEO = 'START_VIDEO'
+    RC = 'RC'
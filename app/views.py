@@ -3,33 +3,43 @@ import asyncio
 from aiohttp import web
 
 import logging
+import os
+import re
+import time
 
+from app import wire
+from app.config import get_config
+from app.connections import Connections
 from app.drone import get_drone_controller
 from app.settings import Commands
 
 logger = logging.getLogger(__name__)
 
 
-class Connections:
-    def __init__(self):
-        self._web_sockets = set()
+def get_drone_id(request):
+    """
+    :return: The drone of the /drones/{drone_id}/ routes, the default drone for the others.
+    :raises web.HTTPNotFound: If the drone is not part of the fleet.
+    """
+    conf = get_config(request.app)
+    drone_id = request.match_info.get('drone_id', conf.default_drone)
 
-    def register(self, websocket):
-        self._web_sockets.add(websocket)
-        logger.info('New websocket registered')
+    if drone_id not in conf.drones:
+        raise web.HTTPNotFound(text=f'Unknown drone {drone_id}')
 
-    def unregister(self, websocket):
-        self._web_sockets.remove(websocket)
-        logger.info('New websocket unregistered')
+    return drone_id
 
 
 class BaseWebSocketView(web.View):
+    # Subprotocols the view can speak besides its default messages, the client picks with Sec-WebSocket-Protocol.
+    protocols = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.connections = Connections()
 
     async def get(self):
-        ws = web.WebSocketResponse()
+        ws = web.WebSocketResponse(protocols=self.protocols)
         await ws.prepare(self.request)
 
         if not await self.is_valid(self.request, ws):
@@ -65,69 +75,220 @@ class BaseWebSocketView(web.View):
 class DroneWebSocketView(BaseWebSocketView):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.dc = get_drone_controller()
+        self.drone_id = get_drone_id(self.request)
+        self.dc = get_drone_controller(self.request.app, self.drone_id)
 
 
 class CommandWebSocketView(DroneWebSocketView):
+    protocols = (wire.PROTOCOL,)
+
     async def handler(self, websocket):
-        while True:
-            command = await websocket.receive_str()
-            command = command.upper()
-
-            if command == Commands.STOP:
-                self.dc.stop()
-            elif command == Commands.FORWARD:
-                self.dc.forward()
-            elif command == Commands.BACKWARDS:
-                self.dc.backward()
-            elif command == Commands.UP:
-                self.dc.up()
-            elif command == Commands.DOWN:
-                self.dc.down()
-            elif command == Commands.LEFT:
-                self.dc.left()
-            elif command == Commands.RIGHT:
-                self.dc.right()
-            elif command == Commands.R_CW:
-                self.dc.rotate_cw()
-            elif command == Commands.R_CCW:
-                self.dc.rotate_ccw()
-            elif command == Commands.TAKEOFF:
-                self.dc.takeoff()
-            elif command == Commands.LAND:
-                self.dc.land()
-            elif command == Commands.F_B:
-                self.dc.flip_b()
-            elif command == Commands.F_F:
-                self.dc.flip_f()
-            elif command == Commands.F_L:
-                self.dc.flip_l()
-            elif command == Commands.F_R:
-                self.dc.flip_r()
-            elif command == Commands.START_VIDEO:
-                self.dc.start_video()
-            elif command == Commands.STOP_VIDEO:
-                self.dc.stop_video()
+        scheduler = self.request.app['command_scheduler'][self.drone_id]
+        rc_sender = self.request.app['rc_sender'][self.drone_id]
+        binary = websocket.ws_protocol == wire.PROTOCOL
+        acks = set()
+        seq = 0
+
+        try:
+            while True:
+                if binary:
+                    message = await websocket.receive_bytes()
+                else:
+                    message = await websocket.receive_str()
+                received_at = time.perf_counter()
+                seq += 1
+
+                try:
+                    command, axes = wire.decode_command(message) if binary else self.parse_command(message)
+                except ValueError as e:
+                    await self.send_ack(websocket, binary, {'seq': seq, 'command': None, 'result': None,
+                                                            'error': str(e), 'coalesced': False, 'latency_ms': 0})
+                    continue
+
+                if command == Commands.RC:
+                    # Streamed, the setpoint isn't acked.
+                    rc_sender.set(*axes)
+                    continue
+
+                if command in scheduler.PRIORITY:
+                    rc_sender.zero()
+
+                # Submitted right away so the queue keeps the order of the messages, the ack waits on its own.
+                try:
+                    future, coalesced = scheduler.submit(command)
+                except ValueError as e:
+                    future, coalesced = asyncio.get_running_loop().create_future(), False
+                    future.set_exception(e)
+
+                ack = asyncio.ensure_future(
+                    self.acknowledge(websocket, binary, seq, command, future, coalesced, received_at)
+                )
+                acks.add(ack)
+                ack.add_done_callback(acks.discard)
+        finally:
+            rc_sender.zero()
+            for ack in acks:
+                ack.cancel()
+
+    @staticmethod
+    def parse_command(message):
+        """
+        :param message: A command name or 'RC left_right forward_back up_down yaw', axes from -100 to 100.
+        :return (str, list): The command and, for RC, its axes.
+        :raises ValueError: If the message is malformed.
+        """
+        words = message.upper().split()
+        if not words:
+            raise ValueError('Empty command')
+
+        if words[0] != Commands.RC:
+            return ' '.join(words), None
+
+        if len(words) != 5:
+            raise ValueError('RC takes 4 axes: left_right forward_back up_down yaw')
+
+        try:
+            return Commands.RC, [int(float(axis)) for axis in words[1:]]
+        except OverflowError:
+            raise ValueError('RC axes must be finite numbers')
+
+    async def acknowledge(self, websocket, binary, seq, command, future, coalesced, received_at):
+        """
+        Sends {seq, command, result, error, coalesced, latency_ms} once the Tello answered the command.
+        """
+        ack = {'seq': seq, 'command': command, 'result': None, 'error': None, 'coalesced': coalesced}
+
+        try:
+            # Shielded, a coalesced future is shared with the other messages it absorbed.
+            ack['result'] = await asyncio.shield(future)
+        except Exception as e:
+            ack['error'] = str(e)
+
+        ack['latency_ms'] = round((time.perf_counter() - received_at) * 1000, 1)
+        await self.send_ack(websocket, binary, ack)
+
+    @staticmethod
+    async def send_ack(websocket, binary, ack):
+        if binary:
+            await websocket.send_bytes(wire.encode_ack(ack))
+        else:
+            await websocket.send_json(ack)
 
 
 class StatusWebSocketView(DroneWebSocketView):
+    protocols = (wire.PROTOCOL,)
+
     async def handler(self, websocket):
-        while True:
-            await websocket.send_json({
-                'battery': self.dc.get_battery(),
-                'height': self.dc.get_height(),
-                'speed': self.dc.get_speed(),
-                'flight_time': self.dc.get_flight_time()
-            })
-            await asyncio.sleep(2)
+        telemetry = self.request.app['telemetry'][self.drone_id]
+
+        await telemetry.subscribe(websocket)
+        try:
+            async for _ in websocket:
+                pass
+        finally:
+            telemetry.unsubscribe(websocket)
+
+
+class VideoWebSocketView(BaseWebSocketView):
+    async def handler(self, websocket):
+        broadcaster = self.request.app['video_broadcaster'][get_drone_id(self.request)]
+
+        subscriber = broadcaster.subscribe()
+        sender = asyncio.ensure_future(subscriber.send_to(websocket))
+        try:
+            async for _ in websocket:
+                pass
+        finally:
+            sender.cancel()
+            broadcaster.unsubscribe(subscriber)
 
 
 class HlsVideoView(web.View):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.dc = get_drone_controller()
+    async def get(self):
+        if 'drone_id' in self.request.match_info:
+            url = self.request.app.router['drone_video_playlist_view'].url_for(drone_id=get_drone_id(self.request))
+        else:
+            url = self.request.app.router['video_playlist_view'].url_for()
+
+        raise web.HTTPFound(url)
+
+
+class HlsPlaylistView(web.View):
+    BLOCKING_RELOAD_TIMEOUT = 6
 
     async def get(self):
-        batch_file_path = self.dc.get_batch_file_path()
+        playlist = self.request.app['playlist'][get_drone_id(self.request)]
+
+        media_sequence = self.request.query.get('_HLS_msn')
+        if media_sequence is not None:
+            try:
+                media_sequence = int(media_sequence)
+            except ValueError:
+                raise web.HTTPBadRequest(text='_HLS_msn must be an integer')
+
+            if not await playlist.wait_for(media_sequence, self.BLOCKING_RELOAD_TIMEOUT):
+                raise web.HTTPServiceUnavailable(text=f'Segment {media_sequence} is not available yet')
+
+        if playlist.body is None:
+            raise web.HTTPNotFound(text='The video stream is not started')
+
+        headers = {'ETag': f'"{playlist.etag}"', 'Cache-Control': 'no-cache'}
+        if self.request.headers.get('If-None-Match') == headers['ETag']:
+            return web.Response(status=304, headers=headers)
+
+        return web.Response(body=playlist.body, content_type='application/vnd.apple.mpegurl', headers=headers)
+
+
+class HlsSegmentView(web.View):
+    SEGMENT_RE = re.compile(r'[\w-]+\.ts')
+
+    async def get(self):
+        name = self.request.match_info['segment']
+        if not self.SEGMENT_RE.fullmatch(name):
+            raise web.HTTPNotFound()
+
+        playlist = self.request.app['playlist'][get_drone_id(self.request)]
+        path = os.path.join(os.path.dirname(playlist.path), name)
+        if not os.path.isfile(path):
+            raise web.HTTPNotFound()
+
+        # Segments never change once listed in the playlist and HlsWriter never reuses a name, even across ffmpeg
+        # restarts. FileResponse sends them with sendfile.
+        return web.FileResponse(path, headers={'Cache-Control': 'public, max-age=31536000, immutable'})
+
+
+class ClustersView(web.View):
+    async def get(self):
+        """
+        Garbage clusters of the drone, those with their centroid in ?bbox=min_x,min_y,max_x,max_y (metres from the
+        takeoff point) if given.
+        """
+        clusters = self.request.app['clusters'][get_drone_id(self.request)]
+
+        bbox = self.request.query.get('bbox')
+        if bbox is None:
+            return web.json_response({'clusters': clusters.query()})
+
+        try:
+            min_x, min_y, max_x, max_y = map(float, bbox.split(','))
+        except ValueError:
+            raise web.HTTPBadRequest(text='bbox must be min_x,min_y,max_x,max_y')
+
+        return web.json_response({'clusters': clusters.query(min_x, min_y, max_x, max_y)})
+
+
+class ReadyView(web.View):
+    async def get(self):
+        """
+        Readiness of the subsystems started in the background, 503 until all of them are up.
+        """
+        app = self.request.app
+
+        drones = {drone_id: dc.is_connected() for drone_id, dc in app['fleet'].items()}
+        detector = None
+        if 'image_process_thread' in app:
+            detector = app['image_process_thread'].ready.is_set()
 
-        return web.FileResponse(batch_file_path)
+        ready = all(drones.values()) and detector is not False
+        return web.json_response({'ready': ready, 'drones': drones, 'detector': detector},
+                                 status=200 if ready else 503)
@@ -0,0 +1,128 @@
+"""
+Binary subprotocol of the /command and /status websockets, negotiated with Sec-WebSocket-Protocol. Clients that
+don't ask for it keep the JSON messages.
+
+Command: opcode (uint8), followed for RC by the four axes (int8).
+Ack: seq (uint32), opcode (uint8), flags (uint8, ACK_ERROR | ACK_COALESCED), latency ms (uint16), then the result or
+the error as UTF-8.
+Telemetry: mask (uint8) of the TELEMETRY_FIELDS present, then one int16 per field present in the field order.
+NONE stands for a value the drone didn't give. A full frame has every field, a delta only the ones that changed.
+"""
+import struct
+
+from app.settings import Commands
+
+PROTOCOL = 'tello.binary.v1'
+
+OPCODES = {
+    0x01: Commands.STOP,
+    0x02: Commands.LAND,
+    0x03: Commands.TAKEOFF,
+    0x10: Commands.FORWARD,
+    0x11: Commands.BACKWARDS,
+    0x12: Commands.LEFT,
+    0x13: Commands.RIGHT,
+    0x14: Commands.UP,
+    0x15: Commands.DOWN,
+    0x16: Commands.R_CW,
+    0x17: Commands.R_CCW,
+    0x20: Commands.F_F,
+    0x21: Commands.F_B,
+    0x22: Commands.F_L,
+    0x23: Commands.F_R,
+    0x30: Commands.START_VIDEO,
+    0x31: Commands.STOP_VIDEO,
+    0x40: Commands.RC,
+}
+COMMAND_OPCODES = {command: opcode for opcode, command in OPCODES.items()}
+
+RC_AXES = struct.Struct('>4b')
+
+ACK = struct.Struct('>IBBH')
+ACK_ERROR = 0x01
+ACK_COALESCED = 0x02
+
+TELEMETRY_FIELDS = ('battery', 'height', 'speed', 'flight_time')
+TELEMETRY = [struct.Struct(f'>B{count}h') for count in range(len(TELEMETRY_FIELDS) + 1)]
+FULL_MASK = (1 << len(TELEMETRY_FIELDS)) - 1
+NONE = -0x8000
+
+
+def decode_command(data):
+    """
+    :return (str, list): The command and, for RC, its axes.
+    :raises ValueError: If the opcode is unknown or the message malformed.
+    """
+    if not data:
+        raise ValueError('Empty command')
+
+    command = OPCODES.get(data[0])
+    if command is None:
+        raise ValueError(f'Unknown opcode {data[0]:#04x}')
+
+    if command == Commands.RC:
+        if len(data) != 1 + RC_AXES.size:
+            raise ValueError('RC takes 4 axes: left_right forward_back up_down yaw')
+        return command, list(RC_AXES.unpack_from(data, 1))
+
+    return command, None
+
+
+def encode_command(command, axes=None):
+    data = bytes([COMMAND_OPCODES[command]])
+    if axes is not None:
+        data += RC_AXES.pack(*axes)
+    return data
+
+
+def encode_ack(ack):
+    """
+    :param ack: {seq, command, result, error, coalesced, latency_ms} as sent to the JSON clients.
+    """
+    flags = (ACK_ERROR if ack['error'] is not None else 0) | (ACK_COALESCED if ack['coalesced'] else 0)
+    text = ack['error'] if ack['error'] is not None else ack['result']
+
+    header = ACK.pack(ack['seq'] & 0xffffffff, COMMAND_OPCODES.get(ack['command'], 0), flags,
+                      min(int(ack['latency_ms']), 0xffff))
+    return header + (text or '').encode('utf-8')
+
+
+def encode_telemetry(snapshot, previous=None):
+    """
+    :param previous: Snapshot the client already has, the frame only carries the fields that changed since.
+        A full frame is encoded if None.
+    """
+    if previous is None:
+        return TELEMETRY[-1].pack(FULL_MASK, *map(_int16, map(snapshot.get, TELEMETRY_FIELDS)))
+
+    mask = 0
+    values = []
+
+    for bit, field in enumerate(TELEMETRY_FIELDS):
+        value = snapshot.get(field)
+        if previous.get(field) != value:
+            mask |= 1 << bit
+            values.append(_int16(value))
+
+    return TELEMETRY[len(values)].pack(mask, *values)
+
+
+def _int16(value):
+    return NONE if value is None else max(-0x7fff, min(0x7fff, int(value)))
+
+
+def decode_telemetry(data, previous=None):
+    """
+    :return (dict): The snapshot, the fields missing from a delta are taken from previous.
+    """
+    mask = data[0]
+    count = bin(mask).count('1')
+    values = iter(TELEMETRY[count].unpack(data)[1:])
+
+    snapshot = dict(previous) if previous is not None else {}
+    for bit, field in enumerate(TELEMETRY_FIELDS):
+        if mask & (1 << bit):
+            value = next(values)
+            snapshot[field] = None if value == NONE else value
+
+    return snapshot
@@ -0,0 +1,27 @@
+"""
+Reports the detection throughput of a detector backend for several batch sizes.
+
+    python -m benchmarks.batch_inference [frames_dir] [backend] [model_path]
+
+Frames are read from the images of frames_dir, or are random noise frames of the Tello resolution. The backend
+is the ImageAI one by default.
+"""
+import sys
+
+from benchmarks.harness import format_result, get_frames, load_backend, measure
+
+BATCH_SIZES = (1, 4, 8, 16)
+
+
+def main():
+    frames = get_frames(sys.argv[1] if len(sys.argv) > 1 else None)
+    # The first call of a batch size builds the graph, keep it out of the measures.
+    backend = load_backend(sys.argv[2] if len(sys.argv) > 2 else 'imageai',
+                           sys.argv[3] if len(sys.argv) > 3 else None, warmup_batch_size=max(BATCH_SIZES))
+
+    for batch_size in BATCH_SIZES:
+        print(f'batch {batch_size:3}  {format_result(measure(backend, frames, batch_size))}')
+
+
+if __name__ == '__main__':
+    main()
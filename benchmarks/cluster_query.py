@@ -0,0 +1,62 @@
+"""
+Fills a cluster index with a day of geotagged detections and times its bounding box queries.
+
+    python -m benchmarks.cluster_query [detections] [queries]
+
+Detections are drawn around random garbage hotspots over a 2 km square, with some scattered ones, and the
+queries are 100 m map viewports.
+"""
+import random
+import statistics
+import sys
+import time
+
+from app.clusters import ClusterIndex
+
+AREA = 2000
+VIEWPORT = 100
+
+
+def make_detections(count):
+    hotspots = [(random.uniform(0, AREA), random.uniform(0, AREA)) for _ in range(count // 50)]
+    detections = []
+    for index in range(count):
+        if random.random() < 0.8:
+            x, y = random.choice(hotspots)
+            x, y = random.gauss(x, 3), random.gauss(y, 3)
+        else:
+            x, y = random.uniform(0, AREA), random.uniform(0, AREA)
+        detections.append((x, y, random.choice(('bottle', 'cup', 'bowl')), index * 2.0))
+    return detections
+
+
+def main(count, queries):
+    detections = make_detections(count)
+    index = ClusterIndex()
+
+    started_at = time.perf_counter()
+    for detection in detections:
+        index.add(*detection)
+    elapsed = time.perf_counter() - started_at
+    print(f'{count} detections in {len(index)} clusters, {elapsed / count * 1e6:.1f} us per insert')
+
+    timings = []
+    found = 0
+    for _ in range(queries):
+        x, y = random.uniform(0, AREA - VIEWPORT), random.uniform(0, AREA - VIEWPORT)
+        started_at = time.perf_counter()
+        found += len(index.query(x, y, x + VIEWPORT, y + VIEWPORT))
+        timings.append((time.perf_counter() - started_at) * 1e6)
+
+    quantiles = statistics.quantiles(timings, n=100)
+    print(f'{VIEWPORT} m viewport, {found / queries:.1f} clusters per query, us: '
+          f'p50 {quantiles[49]:.1f}  p99 {quantiles[98]:.1f}  max {max(timings):.1f}')
+
+    started_at = time.perf_counter()
+    everything = index.query()
+    print(f'whole map, {len(everything)} clusters: {(time.perf_counter() - started_at) * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8 * 3600 // 2,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
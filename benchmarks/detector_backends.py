@@ -0,0 +1,38 @@
+"""
+Runs detector backends over the same frames and reports their batch latency percentiles and throughput.
+
+    python -m benchmarks.detector_backends [--frames DIR] [--batch-size N] [--threads N] backend[=model_path] ...
+
+e.g. `imageai onnxruntime=retinanet.onnx tflite=retinanet_int8.tflite`. --threads sets the intra-op threads of
+ONNX Runtime and the interpreter threads of TensorFlow Lite.
+"""
+import argparse
+
+from benchmarks.harness import format_result, get_frames, load_backend, measure
+
+THREAD_OPTIONS = {'onnxruntime': 'intra_op_threads', 'tflite': 'num_threads'}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('backends', nargs='+', help='backend[=model_path]')
+    parser.add_argument('--frames', help='Directory of the frames, random noise frames without one')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--threads', type=int)
+    args = parser.parse_args()
+
+    frames = get_frames(args.frames)
+
+    for spec in args.backends:
+        name, _, model_path = spec.partition('=')
+        options = {}
+        if args.threads and name in THREAD_OPTIONS:
+            options[THREAD_OPTIONS[name]] = args.threads
+
+        backend = load_backend(name, model_path or None, args.batch_size, **options)
+        result = measure(backend, frames, args.batch_size)
+        print(f'{spec:<40} {format_result(result)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Shared harness of the detector benchmarks: the same frames through any DetectorBackend, timed per batch.
+"""
+import os
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+from app.image_recognition.backends import create_backend
+
+FRAME_SIZE = (720, 960)
+
+
+def load_frames(path, count=32):
+    frames = []
+    for name in sorted(os.listdir(path)):
+        image = cv2.imread(os.path.join(path, name))
+        if image is not None:
+            image = cv2.resize(image, FRAME_SIZE[::-1])
+            frames.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    return frames[:count]
+
+
+def noise_frames(count=32):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, FRAME_SIZE + (3, ), dtype=np.uint8) for _ in range(count)]
+
+
+def get_frames(path=None):
+    """
+    :return: The frames of the images of path, random noise frames of the Tello resolution without one.
+    """
+    return load_frames(path) if path else noise_frames()
+
+
+def load_backend(name, model_path=None, warmup_batch_size=1, **options):
+    """
+    :return (DetectorBackend): The backend, loaded and warmed up for the frames of the harness.
+    """
+    if model_path is not None:
+        options['model_path'] = model_path
+
+    backend = create_backend(name, **options)
+    backend.load()
+    backend.warmup(FRAME_SIZE[::-1], warmup_batch_size)
+    return backend
+
+
+def measure(backend, frames, batch_size=1):
+    """
+    Runs the backend over the frames in batches of batch_size, the last partial batch is left out.
+
+    :return (dict): Batch latencies in ms (p50, p90, p99, max), frames/s and the detections of every frame.
+    """
+    batches = [frames[i:i + batch_size] for i in range(0, len(frames) - batch_size + 1, batch_size)]
+
+    detections, latencies = [], []
+    start = time.perf_counter()
+    for batch in batches:
+        batch_start = time.perf_counter()
+        detections.extend(backend.detect_batch(batch))
+        latencies.append((time.perf_counter() - batch_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'p50': quantiles[49],
+        'p90': quantiles[89],
+        'p99': quantiles[98],
+        'max': max(latencies),
+        'throughput': len(detections) / elapsed,
+        'detections': detections,
+    }
+
+
+def format_result(result):
+    return (f'p50 {result["p50"]:8.1f} ms  p90 {result["p90"]:8.1f} ms  p99 {result["p99"]:8.1f} ms  '
+            f'{result["throughput"]:7.2f} frames/s')
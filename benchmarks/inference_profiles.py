@@ -0,0 +1,78 @@
+"""
+Compares the latency and the accuracy of the inference profiles of the detector backends, and of converted
+models, on the same frames.
+
+    python -m benchmarks.inference_profiles [frames_dir] [backend=model_path ...]
+
+e.g. `frames tflite=retinanet_int8.tflite onnxruntime=retinanet.onnx`. The detections of the 'normal' profile of
+the ImageAI RetinaNet .h5 are the reference: a detection of another setup matches one of the reference of the same
+class overlapping it by IoU >= 0.5. Without frames_dir random noise frames are used, which only measures latency.
+"""
+import sys
+
+import numpy as np
+
+from app.image_recognition.backends import RetinaNetBackend
+from app.image_recognition.tracker import iou_matrix
+from benchmarks.harness import format_result, get_frames, load_backend, measure
+
+MATCH_IOU = 0.5
+
+
+def count_matches(detections, references):
+    matches = 0
+    for objects, reference in zip(detections, references):
+        if not objects or not reference:
+            continue
+
+        iou = iou_matrix(np.array([o['box_points'] for o in objects], np.float32),
+                         np.array([r['box_points'] for r in reference], np.float32))
+        names = np.array([o['name'] for o in objects])
+        reference_names = np.array([r['name'] for r in reference])
+        iou[names[:, None] != reference_names[None, :]] = 0
+
+        # Every reference detection is matched once at most.
+        for _ in range(min(iou.shape)):
+            index = np.unravel_index(np.argmax(iou), iou.shape)
+            if iou[index] < MATCH_IOU:
+                break
+            matches += 1
+            iou[index[0], :] = 0
+            iou[:, index[1]] = 0
+
+    return matches
+
+
+def report(name, result, references):
+    detections = result['detections']
+    found = sum(len(objects) for objects in detections)
+    expected = sum(len(objects) for objects in references)
+    matches = count_matches(detections, references)
+
+    precision = matches / found if found else 1.0
+    recall = matches / expected if expected else 1.0
+    print(f'{name:<40} {format_result(result)}  precision {precision:5.2f}  recall {recall:5.2f}')
+
+
+def main():
+    frames = get_frames(sys.argv[1] if len(sys.argv) > 1 else None)
+    specs = ['imageai'] + sys.argv[2:]
+
+    references = None
+    for spec in specs:
+        name, _, model_path = spec.partition('=')
+        backend = load_backend(name, model_path or None)
+
+        for profile in RetinaNetBackend.PROFILES:
+            backend.set_profile(profile)
+            # A new input size is a new graph.
+            backend.warmup()
+            result = measure(backend, frames)
+            if references is None:
+                references = result['detections']
+
+            report(f'{spec} {profile}', result, references)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Measures the startup of the backend: building the app, starting the server, first answer of /ready and the time
+until /ready reports every subsystem up. The drones bind ephemeral ports, no Tello is needed.
+
+    python -m benchmarks.startup [detection]
+"""
+import asyncio
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+from app import create
+from app.config import Main
+
+
+def make_config(detection):
+    stream_dir = tempfile.mkdtemp()
+
+    class Config(Main):
+        drones = {
+            drone_id: dict(options, local_port=0, state_port=0, video_port=0,
+                           hls_outfile=f'{stream_dir}/{drone_id}/stream.m3u8')
+            for drone_id, options in Main.drones.items()
+        }
+        detection_enabled = detection
+        event_spool_dir = None
+
+    return Config
+
+
+async def main(detection):
+    started_at = time.perf_counter()
+    app = create(make_config(detection))
+    created_at = time.perf_counter()
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    serving_at = time.perf_counter()
+
+    url = f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/ready'
+    first_at = ready_at = None
+    async with aiohttp.ClientSession() as session:
+        while ready_at is None:
+            async with session.get(url) as response:
+                if first_at is None:
+                    first_at = time.perf_counter()
+                if response.status == 200:
+                    ready_at = time.perf_counter()
+                else:
+                    await asyncio.sleep(0.01)
+
+    await runner.cleanup()
+
+    print(f'create {(created_at - started_at) * 1000:.1f} ms  '
+          f'serving {(serving_at - started_at) * 1000:.1f} ms  '
+          f'first /ready {(first_at - started_at) * 1000:.1f} ms  '
+          f'ready {(ready_at - started_at) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    asyncio.run(main(len(sys.argv) > 1 and sys.argv[1] == 'detection'))
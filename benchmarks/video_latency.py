@@ -0,0 +1,104 @@
+"""
+Measures the latency of the live video websocket, from the UDP ingress of the last datagram of a frame to the
+reception of the frame by a websocket client.
+
+    python -m benchmarks.video_latency [frames] [clients]
+"""
+import asyncio
+import os
+import socket
+import statistics
+import struct
+import sys
+import threading
+import time
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.broadcast import VideoBroadcaster
+from app.config import Main
+from app.drone.video import FrameAssembler, VideoReceiver
+from app.views import VideoWebSocketView
+
+FPS = 30
+
+
+def make_frame(index):
+    # An IDR frame every 30 frames, the frame index is right after the NAL header.
+    nal_type = 0x65 if index % FPS == 0 else 0x41
+    payload = b'\x00\x00\x00\x01' + bytes([nal_type]) + struct.pack('>I', index)
+    return payload + os.urandom(FrameAssembler.PACKET_SIZE * 6 + 500 - len(payload))
+
+
+def send_frames(port, count, sent_at):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for index in range(count):
+        frame = make_frame(index)
+        packets = [frame[i:i + FrameAssembler.PACKET_SIZE] for i in range(0, len(frame), FrameAssembler.PACKET_SIZE)]
+        for packet in packets[:-1]:
+            sock.sendto(packet, ('127.0.0.1', port))
+        sent_at[index] = time.perf_counter()
+        sock.sendto(packets[-1], ('127.0.0.1', port))
+        time.sleep(1 / FPS)
+    sock.close()
+
+
+async def receive_frames(session, url, count, received_at):
+    async with session.ws_connect(url) as websocket:
+        while len(received_at) < count:
+            try:
+                message = await asyncio.wait_for(websocket.receive_bytes(), 2)
+            except asyncio.TimeoutError:
+                break
+            index, = struct.unpack_from('>I', message, 5)
+            received_at.setdefault(index, time.perf_counter())
+
+
+async def main(count, clients):
+    VideoReceiver.VS_UDP_PORT = 0
+    receiver = VideoReceiver('127.0.0.1', 8889)
+    receiver.writers = []
+
+    app = web.Application()
+    app.router.add_route('GET', '/video/ws', VideoWebSocketView)
+    app['config'] = Main
+    broadcaster = VideoBroadcaster()
+    broadcaster.start()
+    app['video_broadcaster'] = {Main.default_drone: broadcaster}
+    receiver.add_listener(broadcaster.publish)
+
+    server = TestServer(app)
+    await server.start_server()
+    receiver.start_video()
+    port = receiver.socket_video.getsockname()[1]
+
+    sent_at = {}
+    received = [{} for _ in range(clients)]
+    async with aiohttp.ClientSession() as session:
+        receivers = [
+            asyncio.ensure_future(receive_frames(session, server.make_url('/video/ws'), count, received_at))
+            for received_at in received
+        ]
+        await asyncio.sleep(0.2)
+
+        sender = threading.Thread(target=send_frames, args=(port, count, sent_at))
+        sender.start()
+        await asyncio.gather(*receivers)
+        sender.join()
+
+    receiver.stop_video()
+    await server.close()
+
+    latencies = sorted(
+        (received_at[index] - sent_at[index]) * 1000
+        for received_at in received for index in received_at if index in sent_at
+    )
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f'{len(latencies)} frames to {clients} clients, latency ms: '
+          f'p50 {quantiles[49]:.2f}  p90 {quantiles[89]:.2f}  p99 {quantiles[98]:.2f}  max {latencies[-1]:.2f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 300, int(sys.argv[2]) if len(sys.argv) > 2 else 4))
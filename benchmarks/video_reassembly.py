@@ -0,0 +1,147 @@
+"""
+Replays a captured Tello video packet stream over a local datagram socket through the frame reassembly and
+reports packets/s and the memory allocated per packet.
+
+    python -m benchmarks.video_reassembly [capture_file]
+
+A capture file is a sequence of datagrams, each prefixed by its length as a 2 bytes big endian integer.
+Without one, a synthetic stream with the Tello packet layout is replayed.
+
+Allocations are counted per packet from the tracemalloc peak between two receive calls, so the blocks freed
+before the next packet, like the intermediate bytes of a concatenation, are counted too. Copies are the bytes
+allocated per byte of payload received.
+"""
+import array
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+
+from app.drone.video import FrameAssembler
+
+
+def load_capture(path):
+    packets = []
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(2)
+            if len(header) < 2:
+                break
+            packets.append(f.read(struct.unpack('>H', header)[0]))
+    return packets
+
+
+def synthetic_capture(frames=2000, gop=30):
+    # Keyframes span about 40 datagrams, the predicted frames between them about 8.
+    packets = []
+    for i in range(frames):
+        packets.extend(os.urandom(FrameAssembler.PACKET_SIZE) for _ in range(40 if i % gop == 0 else 8))
+        packets.append(os.urandom(700))
+    return packets
+
+
+def concatenate(sock, count, sink):
+    packet_data = b''
+    for _ in range(count):
+        res_string, ip = sock.recvfrom(2048)
+        packet_data += res_string
+        if len(res_string) != FrameAssembler.PACKET_SIZE:
+            sink(packet_data)
+            packet_data = b''
+
+
+def reassemble(sock, count, sink):
+    assembler = FrameAssembler()
+    for _ in range(count):
+        frame = assembler.receive(sock)
+        if frame is not None:
+            sink(frame)
+
+
+def send_all(sock, packets):
+    for packet in packets:
+        sock.send(packet)
+
+
+class AllocationProbe:
+    """
+    Socket wrapper sampling the traced memory at every receive call, tracemalloc must be tracing.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.allocated = 0
+
+        # The sampling must not allocate itself: the start is kept out of int objects and the methods are bound once.
+        self._start = array.array('q', [tracemalloc.get_traced_memory()[0]])
+        tracemalloc.reset_peak()
+        self.recvfrom = self._recvfrom
+        self.recv_into = self._recv_into
+
+    def sample(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if peak > self._start[0]:
+            self.allocated += peak - self._start[0]
+        self._start[0] = current
+        del current, peak
+        tracemalloc.reset_peak()
+
+    def _recvfrom(self, bufsize):
+        self.sample()
+        return self.sock.recvfrom(bufsize)
+
+    def _recv_into(self, buffer):
+        self.sample()
+        return self.sock.recv_into(buffer)
+
+
+def replay(handler, packets, trace=False):
+    frames = []
+    sink = lambda frame: frames.append(len(frame))
+
+    receiver, sender = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sender_thread = threading.Thread(target=send_all, args=(sender, packets))
+
+    probe = None
+    if trace:
+        tracemalloc.start()
+        probe = receiver = AllocationProbe(receiver)
+    start = time.perf_counter()
+    sender_thread.start()
+    handler(receiver, len(packets), sink)
+    elapsed = time.perf_counter() - start
+    if trace:
+        probe.sample()
+        tracemalloc.stop()
+        receiver = probe.sock
+
+    sender_thread.join()
+    receiver.close()
+    sender.close()
+
+    return elapsed, len(frames), probe
+
+
+def run(name, handler, packets):
+    elapsed, frames, _ = replay(handler, packets)
+    # Tracing slows the allocations down a lot, so memory is measured on a separate replay.
+    _, _, probe = replay(handler, packets, trace=True)
+
+    payload = sum(map(len, packets))
+    print(f'{name:12} {len(packets) / elapsed:12.0f} packets/s {frames:6} frames  '
+          f'{probe.allocated / len(packets):9.1f} B allocated/packet  '
+          f'{probe.allocated / payload:6.2f} copies')
+
+
+def main():
+    packets = load_capture(sys.argv[1]) if len(sys.argv) > 1 else synthetic_capture()
+
+    run('concatenate', concatenate, packets)
+    run('recv_into', reassemble, packets)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Compares the JSON messages of /command and /status with the binary subprotocol: bytes per message and encode and
+decode time.
+
+    python -m benchmarks.wire_encoding [iterations]
+
+The telemetry is a synthetic flight where, like on the Tello, the battery and flight time move slower than the
+polling, so most deltas only carry a field or two. Flights of FLIGHT_SNAPSHOTS snapshots follow each other, so every
+value stays in the range of a Tello, and of int16, whatever the iterations.
+"""
+import json
+import random
+import sys
+import timeit
+
+from app import wire
+from app.settings import Commands
+from app.views import CommandWebSocketView
+
+
+# An hour long flight polled at 2 Hz.
+FLIGHT_SNAPSHOTS = 7200
+
+
+def make_snapshots(count):
+    snapshots = []
+    height, speed = 0, 0
+    for index in range(count):
+        tick = index % FLIGHT_SNAPSHOTS
+        height = min(100, max(0, height + random.choice((-1, 0, 0, 1))))
+        speed = min(100, max(0, speed + random.choice((-5, 0, 0, 5))))
+        snapshots.append({'battery': 100 - tick // 80, 'height': height, 'speed': speed, 'flight_time': tick // 2})
+    return snapshots
+
+
+def report(name, size, seconds, iterations):
+    print(f'{name:<28} {size:>7.1f} B  {seconds / iterations * 1e6:>7.2f} us')
+
+
+def main(iterations):
+    snapshots = make_snapshots(iterations)
+    pairs = list(zip([None] + snapshots[:-1], snapshots))
+
+    print(f'{"":<28} {"size":>9}  {"time/msg":>10}')
+
+    frames = [json.dumps(snapshot) for snapshot in snapshots]
+    report('status json encode', sum(map(len, frames)) / iterations,
+           timeit.timeit(lambda: [json.dumps(snapshot) for snapshot in snapshots], number=1), iterations)
+    report('status json decode', sum(map(len, frames)) / iterations,
+           timeit.timeit(lambda: [json.loads(frame) for frame in frames], number=1), iterations)
+
+    full = [wire.encode_telemetry(snapshot) for snapshot in snapshots]
+    report('status binary full encode', sum(map(len, full)) / iterations,
+           timeit.timeit(lambda: [wire.encode_telemetry(snapshot) for snapshot in snapshots], number=1), iterations)
+
+    deltas = [wire.encode_telemetry(snapshot, previous) for previous, snapshot in pairs]
+    report('status binary delta encode', sum(map(len, deltas)) / iterations,
+           timeit.timeit(lambda: [wire.encode_telemetry(snapshot, previous) for previous, snapshot in pairs],
+                         number=1), iterations)
+
+    def decode_deltas():
+        snapshot = None
+        for delta in deltas:
+            snapshot = wire.decode_telemetry(delta, snapshot)
+        return snapshot
+
+    assert decode_deltas() == snapshots[-1]
+    report('status binary delta decode', sum(map(len, deltas)) / iterations,
+           timeit.timeit(decode_deltas, number=1), iterations)
+
+    commands = [random.choice(list(wire.COMMAND_OPCODES)) for _ in range(iterations)]
+    texts = ['RC 10 -20 0 35' if command == Commands.RC else command for command in commands]
+    report('command text parse', sum(map(len, texts)) / iterations,
+           timeit.timeit(lambda: [CommandWebSocketView.parse_command(text) for text in texts], number=1), iterations)
+
+    messages = [wire.encode_command(*CommandWebSocketView.parse_command(text)) for text in texts]
+    report('command binary decode', sum(map(len, messages)) / iterations,
+           timeit.timeit(lambda: [wire.decode_command(message) for message in messages], number=1), iterations)
+
+    ack = {'seq': 1, 'command': 'FORWARD', 'result': 'ok', 'error': None, 'coalesced': False, 'latency_ms': 12.5}
+    report('ack json encode', len(json.dumps(ack)),
+           timeit.timeit(lambda: json.dumps(ack), number=iterations), iterations)
+    report('ack binary encode', len(wire.encode_ack(ack)),
+           timeit.timeit(lambda: wire.encode_ack(ack), number=iterations), iterations)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
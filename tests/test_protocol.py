@@ -0,0 +1,68 @@
+import asyncio
+
+from app.drone.protocol import CommandProtocol
+
+TELLO = ('192.168.10.1', 8889)
+
+
+class FakeTelloTransport:
+    """
+    Answers every datagram with b'reply-to:<datagram>' after delay seconds, except the ones numbered in lost.
+    """
+
+    def __init__(self, protocol, delay=0.01, lost=()):
+        self.protocol = protocol
+        self.delay = delay
+        self.lost = set(lost)
+        self.sent = 0
+
+    def sendto(self, data, address):
+        self.sent += 1
+        if self.sent not in self.lost:
+            asyncio.get_running_loop().call_later(self.delay, self.protocol.datagram_received,
+                                                  b'reply-to:' + data, address)
+
+
+async def requests(commands, timeout=0.1, **transport_options):
+    protocol = CommandProtocol()
+    protocol.connection_made(FakeTelloTransport(protocol, **transport_options))
+
+    replies = []
+    for command in commands:
+        try:
+            replies.append(await protocol.request(command, TELLO, timeout))
+        except asyncio.TimeoutError:
+            replies.append(None)
+    return replies
+
+
+def test_replies_in_order():
+    assert asyncio.run(requests([b'battery?', b'height?'])) == [b'reply-to:battery?', b'reply-to:height?']
+
+
+def test_late_reply_is_dropped():
+    # The first reply comes after the timeout, while the second command waits.
+    protocol = CommandProtocol()
+    transport = FakeTelloTransport(protocol)
+    protocol.connection_made(transport)
+
+    async def run():
+        transport.delay = 0.15
+        try:
+            await protocol.request(b'forward 30', TELLO, 0.1)
+        except asyncio.TimeoutError:
+            pass
+        transport.delay = 0.1
+        return [await protocol.request(command, TELLO, 0.2) for command in (b'battery?', b'height?')]
+
+    assert asyncio.run(run()) == [b'reply-to:battery?', b'reply-to:height?']
+
+
+def test_lost_reply_costs_one_command():
+    commands = [b'battery?', b'height?', b'speed?', b'time?', b'wifi?', b'sdk?', b'sn?']
+
+    replies = asyncio.run(requests(commands, lost=[1]))
+
+    # The reply of height? is taken for the late one of battery?, the channel is in step again after it.
+    assert replies[:2] == [None, None]
+    assert replies[2:] == [b'reply-to:' + command for command in commands[2:]]
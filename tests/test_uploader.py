@@ -0,0 +1,159 @@
+import asyncio
+import base64
+import json
+
+from aiohttp import web
+
+from app.events.spool import EventSpool
+from app.events.uploader import EventUploader
+
+JPEG = b'\xff\xd8jpeg'
+PNG = b'\x89PNGpng'
+
+
+class StubEventServer:
+    """
+    Local event server recording the requests it gets, answering the statuses given, then 200.
+    """
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        self.runner = None
+        self.url = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/event', self.handle)
+
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', 0).start()
+
+        host, port = self.runner.addresses[0][:2]
+        self.url = f'http://{host}:{port}/event'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def handle(self, request):
+        if request.content_type == 'application/json':
+            self.requests.append(await request.json())
+        else:
+            parts = []
+            reader = await request.multipart()
+            async for part in reader:
+                parts.append((part.name, part.filename, part.headers.get('Content-Type'), await part.read()))
+            self.requests.append(parts)
+
+        return web.Response(status=self.statuses.pop(0) if self.statuses else 200)
+
+
+async def upload(events, statuses=(), **options):
+    """
+    :return (StubEventServer, EventUploader): Once the uploader sent or gave up on every event.
+    """
+    server = StubEventServer(statuses)
+    await server.start()
+
+    options = dict({'batch_size': 2, 'batch_wait': 0.05, 'retry_backoff': 0.01}, **options)
+    uploader = EventUploader(server.url, 'drone-1', **options)
+    await uploader.start()
+
+    try:
+        for objects, image, thumbnail in events:
+            uploader.submit(objects, image, thumbnail)
+
+        for _ in range(200):
+            if uploader.sent + uploader.failed + uploader.rejected == len(events):
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await uploader.close()
+        await server.stop()
+
+    return server, uploader
+
+
+def test_batches_events_by_batch_size():
+    events = [([{'name': 'bottle', 'index': index}], JPEG, None) for index in range(5)]
+
+    server, uploader = asyncio.run(upload(events))
+
+    assert uploader.sent == 5
+    assert [len(body['events']) for body in server.requests] == [2, 2, 1]
+    assert [event['objects'][0]['index'] for body in server.requests for event in body['events']] == list(range(5))
+
+
+def test_base64_body():
+    objects = [{'name': 'bottle', 'percentage_probability': 87.5, 'box_points': [1, 2, 3, 4]}]
+
+    server, _ = asyncio.run(upload([(objects, JPEG, PNG), (objects, JPEG, None)]))
+
+    assert server.requests == [{
+        'droneId': 'drone-1',
+        'events': [
+            {'objects': objects, 'image': base64.b64encode(JPEG).decode('ascii'),
+             'thumbnail': base64.b64encode(PNG).decode('ascii')},
+            {'objects': objects, 'image': base64.b64encode(JPEG).decode('ascii')},
+        ]
+    }]
+
+
+def test_multipart_fields_in_order():
+    events = [([{'name': 'bottle'}], JPEG, PNG), ([{'name': 'cup'}], PNG, None)]
+
+    server, _ = asyncio.run(upload(events, mode='multipart'))
+
+    [parts] = server.requests
+    assert [(name, filename, content_type) for name, filename, content_type, _ in parts] == [
+        ('droneId', None, 'text/plain; charset=utf-8'),
+        ('events', None, 'application/json'),
+        ('image', '0.jpg', 'image/jpeg'),
+        ('thumbnail', '0.png', 'image/png'),
+        ('image', '1.png', 'image/png'),
+    ]
+    assert parts[0][3] == b'drone-1'
+    assert json.loads(parts[1][3]) == [[{'name': 'bottle'}], [{'name': 'cup'}]]
+    assert [part[3] for part in parts[2:]] == [JPEG, PNG, PNG]
+
+
+def test_retries_after_service_unavailable():
+    server, uploader = asyncio.run(upload([([{'name': 'bottle'}], JPEG, None)], statuses=[503]))
+
+    assert uploader.sent == 1
+    assert uploader.failed == 0
+    assert len(server.requests) == 2
+    assert server.requests[0] == server.requests[1]
+
+
+def test_gives_up_after_max_retries():
+    server, uploader = asyncio.run(upload([([{'name': 'bottle'}], JPEG, None)], statuses=[503] * 3,
+                                          max_retries=3))
+
+    assert uploader.sent == 0
+    assert uploader.failed == 1
+    assert len(server.requests) == 3
+
+
+def test_rejected_batch_is_not_retried():
+    server, uploader = asyncio.run(upload([([{'name': 'bottle'}], JPEG, None)], statuses=[422]))
+
+    assert uploader.sent == 0
+    assert uploader.rejected == 1
+    assert len(server.requests) == 1
+
+
+def test_rejected_batch_leaves_the_spool(tmp_path):
+    events = [([{'name': 'bottle', 'index': index}], JPEG, None) for index in range(4)]
+
+    server, uploader = asyncio.run(upload(events, statuses=[400], spool=EventSpool(str(tmp_path))))
+
+    assert uploader.rejected == 2
+    assert uploader.sent == 2
+    assert [event['objects'][0]['index'] for body in server.requests[1:] for event in body['events']] == [2, 3]
+    spool = EventSpool(str(tmp_path))
+    try:
+        assert spool.is_empty()
+    finally:
+        spool.close()